@@ -0,0 +1,110 @@
+"""
+Batched mode of the vectorized engine: B independent worlds of the same size, each with its own
+configuration, stepped together by one engine. The per-cell arrays of the worlds are stacked into one flat
+array of B * rows * cols cells, so every phase of a day costs one set of array operations for the whole
+batch instead of one per world.
+"""
+import numpy as np
+
+from cells import neighbor_table
+from config import SimulationConfig
+from generation import generate_state
+from vectorized import VectorizedEngine, ERBAST, CARVIZ, ANIMAL_COLUMNS
+from constants import WATER_COLOR, GROUND_COLOR
+
+# Parameters of SimulationConfig that may differ between the worlds of a batch
+BATCHED_PARAMETERS = ("max_group", "max_energy", "max_life", "aging", "growing")
+
+
+class BatchedEngine(VectorizedEngine):
+    """
+    Step B worlds with the rules of VectorizedEngine, through arrays that stack the cells of the worlds:
+    cell (b, x, y) has the flat index b * rows * cols + x * cols + y. The neighbor table is block diagonal,
+    so animals and groups never leave their world, and the parameters of each world are looked up by the
+    world of the cell (see _parameter).
+
+    ASSUMPTION: The worlds share the random generator of the engine, so a world of a batch is a valid run of
+    its configuration but not the same run as the world simulated alone with the same seed.
+    """
+
+    def __init__(self, configs: list, topology: str = "bounded", rng: np.random.Generator | None = None):
+        if not configs:
+            raise ValueError("A batch needs at least one configuration")
+        rows, cols = configs[0].rows, configs[0].cols
+        if any((config.rows, config.cols) != (rows, cols) for config in configs):
+            raise ValueError("All the worlds of a batch must have the same number of rows and cols")
+        super().__init__(rows, cols, topology, rng, configs[0])
+        self.configs = list(configs)
+        self.batch = len(configs)
+        self.world_cells = rows * cols
+        self.n_cells = self.batch * self.world_cells
+
+        neighbors, neighbors_valid = neighbor_table(rows, cols, topology)
+        offsets = np.arange(self.batch)[:, None, None] * self.world_cells
+        self.neighbors = (neighbors[None] + offsets).reshape(self.n_cells, -1)
+        self.neighbors_valid = np.tile(neighbors_valid, (self.batch, 1))
+
+        self.ground = np.zeros(self.n_cells, dtype=bool)
+        self.has_vegetebob = np.zeros(self.n_cells, dtype=bool)
+        self.density = np.zeros(self.n_cells, dtype=np.float64)
+
+        # One value per world of every parameter, indexed by world
+        self.parameters = {name: np.array([getattr(config, name) for config in self.configs])
+                           for name in BATCHED_PARAMETERS}
+
+    def _parameter(self, name: str, cells: np.ndarray):
+        return self.parameters[name][cells // self.world_cells]
+
+    def world_of(self, cells: np.ndarray) -> np.ndarray:
+        # Returns the index in the batch of the world of each flat cell index
+        return cells // self.world_cells
+
+    def generate(self, terrain: str = "random"):
+        """Generate every world of the batch with its own caps, see generation.generate_state."""
+        states = [generate_state(self.rows, self.cols, self.rng, terrain, config, self.topology)
+                  for config in self.configs]
+        self.ground = np.concatenate([state["ground"] for state in states])
+        self.has_vegetebob = np.concatenate([state["has_vegetebob"] for state in states])
+        self.density = np.concatenate([state["density"] for state in states])
+        self._clear_animals()
+        for world, state in enumerate(states):
+            animals = dict(state["animals"])
+            animals["cell"] = animals["cell"] + world * self.world_cells
+            self._append({column: animals[column] for column in ANIMAL_COLUMNS})
+
+    # --- queries ------------------------------------------------------------------------------------
+
+    def population_counts(self) -> dict:
+        """Return the population of every species as an array with one count per world."""
+        return {
+            "vegetebob": self.has_vegetebob.reshape(self.batch, -1).sum(axis=1),
+            "erbast": np.bincount(self.world_of(self.cell[self.species == ERBAST]), minlength=self.batch),
+            "carviz": np.bincount(self.world_of(self.cell[self.species == CARVIZ]), minlength=self.batch),
+        }
+
+    def species_count_maps(self) -> dict:
+        """Return the per-cell count of every species as B x rows x cols arrays."""
+        shape = (self.batch, self.rows, self.cols)
+        return {
+            "vegetebob": self.has_vegetebob.astype(np.int64).reshape(shape),
+            "erbast": self.species_counts(ERBAST).reshape(shape),
+            "carviz": self.species_counts(CARVIZ).reshape(shape),
+        }
+
+    def terrain_map(self) -> np.ndarray:
+        return np.where(self.ground, GROUND_COLOR, WATER_COLOR).reshape(self.batch, self.rows, self.cols)
+
+    def density_map(self) -> np.ndarray:
+        return np.where(self.has_vegetebob, self.density, 0.0).reshape(self.batch, self.rows, self.cols)
+
+
+def make_configs(batch: int, base: SimulationConfig | None = None, **parameters) -> list:
+    """
+    Build the configurations of a batch from a base configuration, with parameters given as sequences of
+    one value per world, e.g. make_configs(3, growing=[0.5, 1, 2]).
+    """
+    base = base if base is not None else SimulationConfig()
+    for name, values in parameters.items():
+        if len(values) != batch:
+            raise ValueError(f"Expected {batch} values of {name}, got {len(values)}")
+    return [base.replace(**{name: values[world] for name, values in parameters.items()}) for world in range(batch)]
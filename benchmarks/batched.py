@@ -0,0 +1,49 @@
+"""
+Measure the cost of a day of B worlds: B vectorized engines stepped one after the other against one
+BatchedEngine stepping the B worlds together. Small grids show the interpreter overhead that the batch
+amortizes.
+
+Usage: python -m benchmarks.batched
+"""
+import time
+
+import numpy as np
+
+from batched import BatchedEngine
+from config import SimulationConfig
+from vectorized import VectorizedEngine
+
+BATCHES = (1, 8, 64)
+SIZE = 20
+DAYS = 50
+
+
+def measure(engines: list) -> float:
+    """
+    Live DAYS days with every engine in turn.
+    :return: The seconds per day of the whole group of engines
+    """
+    start = time.perf_counter()
+    for _ in range(DAYS):
+        for engine in engines:
+            engine.live_day()
+    return (time.perf_counter() - start) / DAYS
+
+
+def main():
+    config = SimulationConfig(rows=SIZE, cols=SIZE)
+    print(f"{'worlds':>7}{'separate ms/day':>17}{'batched ms/day':>16}{'speedup':>9}")
+    for batch in BATCHES:
+        separate = []
+        for world in range(batch):
+            engine = VectorizedEngine(SIZE, SIZE, rng=np.random.default_rng(world), config=config)
+            engine.generate()
+            separate.append(engine)
+        batched = BatchedEngine([config] * batch, rng=np.random.default_rng(0))
+        batched.generate()
+        sequential, together = measure(separate), measure([batched])
+        print(f"{batch:>7}{sequential * 1e3:>17.2f}{together * 1e3:>16.2f}{sequential / together:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure the memory per entity and the creation throughput of the slotted entity and group classes,
+against subclasses that get a per-instance __dict__ back, i.e. the layout before __slots__.
+
+Usage: python -m benchmarks.entity_memory
+"""
+import sys
+import time
+import tracemalloc
+
+from world import World
+from species import Vegetebob, Erbast, Carviz
+from groups import Herd, Pride
+
+N = 20000
+
+
+def with_dict(cls):
+    # A subclass without __slots__ has a __dict__ like the classes had before; keep the original name()
+    return type(f"Dict{cls.__name__}", (cls,), {"name": classmethod(lambda subclass: cls.name())})
+
+
+def instance_bytes(instance) -> int:
+    size = sys.getsizeof(instance)
+    if hasattr(instance, "__dict__"):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+
+def measure(cls, make, cell_factory):
+    """
+    Create N instances with make(cls, cell), once timed and once traced, each time in a fresh cell.
+    :return: The shallow bytes per instance, the traced bytes per instance and the instances per second
+    """
+    cell = cell_factory()
+    start = time.perf_counter()
+    instances = [make(cls, cell) for _ in range(N)]
+    elapsed = time.perf_counter() - start
+    shallow = instance_bytes(instances[0])
+    del instances
+
+    cell = cell_factory()
+    tracemalloc.start()
+    instances = [make(cls, cell) for _ in range(N)]
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return shallow, traced / N, N / elapsed
+
+
+def main():
+    world = World(3, 3)
+
+    def empty_ground_cell():
+        # Returns the middle cell of a freshly generated world, so that every measurement starts from empty sets
+        world.generate()
+        cell = world.cells_grid[1, 1]
+        for species in cell.population.values():
+            species.clear()
+        cell.cell_type = "ground"
+        return cell
+
+    cases = [
+        (Vegetebob, lambda cls, cell: cls(spawn_cell=cell)),
+        (Erbast, lambda cls, cell: cls(spawn_cell=cell)),
+        (Carviz, lambda cls, cell: cls(spawn_cell=cell)),
+        (Herd, lambda cls, cell: cls(cell)),
+        (Pride, lambda cls, cell: cls(cell)),
+    ]
+    print(f"{'class':<10}{'layout':<8}{'bytes':>8}{'traced bytes':>14}{'created/s':>12}")
+    for cls, make in cases:
+        for layout, measured_cls in (("dict", with_dict(cls)), ("slots", cls)):
+            shallow, traced, throughput = measure(measured_cls, make, empty_ground_cell)
+            print(f"{cls.__name__:<10}{layout:<8}{shallow:>8}{traced:>14.0f}{throughput:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure the cost of a hunt in crowded cells: the former linear max() over the erbasts of the cell against
+the energy-ordered index of the cell. Each hunt removes its victim, so the index also pays for the outdated
+entries it drops.
+
+Usage: python -m benchmarks.hunting
+"""
+import time
+
+from world import World
+from species import Erbast, Carviz
+from groups import Pride
+
+CROWDS = (10, 100, 1000, 10000)
+HUNTS = 200
+
+
+def linear_strongest_erbast(pride: Pride) -> Erbast:
+    # The lookup of Pride.find_strongest_erbast before the index
+    return max(pride.current_cell.population["erbast"], key=lambda instance: instance.energy)
+
+
+def crowded_cell(world: World, crowd: int):
+    """
+    Fill the middle cell of a freshly generated world with crowd erbasts and a pride of one carviz.
+    :return: The pride
+    """
+    world.generate(seed=crowd)
+    cell = world.cells_grid[1, 1]
+    cell.cell_type = "ground"
+    for _ in range(crowd):
+        Erbast(cell)
+    carviz = Carviz(cell)
+    pride = Pride(cell, carviz)
+    carviz._add_to_group(pride)
+    return pride
+
+
+def measure(crowd: int, find) -> float:
+    """
+    Hunt HUNTS times in a cell of crowd erbasts, looking the victim up with find(pride).
+    :return: The seconds per hunt
+    """
+    world = World(3, 3)
+    pride = crowded_cell(world, crowd)
+    hunts = min(HUNTS, crowd)
+    start = time.perf_counter()
+    for _ in range(hunts):
+        victim = find(pride)
+        for carviz in pride.individuals:
+            carviz.energy += victim.energy / len(pride.individuals)
+        victim.delete()
+    return (time.perf_counter() - start) / hunts
+
+
+def main():
+    print(f"{'erbasts':>8}{'linear us/hunt':>16}{'indexed us/hunt':>17}{'speedup':>9}")
+    for crowd in CROWDS:
+        linear = measure(crowd, linear_strongest_erbast)
+        indexed = measure(crowd, Pride.find_strongest_erbast)
+        print(f"{crowd:>8}{linear * 1e6:>16.2f}{indexed * 1e6:>17.2f}{linear / indexed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Time the costly operations of the simulation at several grid sizes and population densities, with fixed
+seeds, and compare two runs to catch regressions.
+
+The density is the number of erbasts, and of carvizes, per ground cell: the generated population is topped
+up with animals spawned on random ground cells until it reaches it. The group operations are timed on a
+world that lived the first phase of a day, with every group of two or more animals split in two, so that
+Herd.join_all and Pride.initiate_fight always have groups to merge and to fight.
+
+Usage: python -m benchmarks.suite run --sizes 50 100 --densities 0.1 0.5 --output results.json
+       python -m benchmarks.suite compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from world import World
+from species import Erbast, Carviz
+from groups import Herd, Pride
+
+FORMAT_VERSION = 1
+SIZES = (50, 100, 200, 500, 1000)
+DENSITIES = (0.1, 0.5, 1.0)
+
+
+def populate(world: World, density: float):
+    """Spawn erbasts and carvizes on random ground cells until each species has density animals per ground cell."""
+    ground = [cell for cell in world.cells_grid.ravel() if cell.cell_type == "ground"]
+    for animal_class in (Erbast, Carviz):
+        missing = round(density * len(ground)) - len(world.population[animal_class.name()])
+        for _ in range(max(missing, 0)):
+            animal_class(world.random.choice(ground))
+
+
+def split_groups(world: World, group_class):
+    """Move half of the members of every group of group_class with two or more members into a new group."""
+    for group in list(world.groups.of_type(group_class.name())):
+        if len(group.individuals) < 2:
+            continue
+        members = sorted(group.individuals, key=lambda individual: individual.energy)[:len(group.individuals) // 2]
+        for individual in members:
+            individual.remove_from_current_group()
+        new_group = group_class(group.current_cell, *members)
+        for individual in members:
+            individual._add_to_group(new_group)
+
+
+def make_world(size: int, density: float, seed: int, first_phase: bool = False) -> World:
+    world = World(size, size, seed=seed)
+    world.generate()
+    populate(world, density)
+    world.evaluate_dirty_cells()
+    if first_phase:
+        world._live_first_phase()
+        world.evaluate_dirty_cells()
+        split_groups(world, Herd)
+        split_groups(world, Pride)
+    return world
+
+
+def time_calls(function, targets) -> tuple:
+    """
+    Call function on every target.
+    :return: The number of calls and the elapsed seconds
+    """
+    start = time.perf_counter()
+    calls = 0
+    for target in targets:
+        function(target)
+        calls += 1
+    return calls, time.perf_counter() - start
+
+
+def bench_generate(size, density, seed):
+    world = World(size, size, seed=seed)
+    start = time.perf_counter()
+    world.generate()
+    return 1, time.perf_counter() - start
+
+
+def bench_live_day(size, density, seed):
+    world = make_world(size, density, seed)
+    return time_calls(lambda _: world.live_day(), range(3))
+
+
+def bench_trigger_appeal_evaluation(size, density, seed):
+    world = make_world(size, density, seed)
+    return time_calls(lambda cell: cell.trigger_appeal_evaluation(), world.cells_grid.ravel())
+
+
+def bench_get_best_cell_in_neighborhood(size, density, seed):
+    world = make_world(size, density, seed)
+    animals = [animal for species in (Erbast, Carviz) for animal in world.population[species.name()]]
+    return time_calls(lambda animal: animal.get_best_cell_in_neighborhood(), animals)
+
+
+def bench_herd_join_all(size, density, seed):
+    world = make_world(size, density, seed, first_phase=True)
+    herds = list(world.groups.of_type(Herd.name()))
+    return time_calls(lambda herd: None if herd.deleted else herd.join_all(), herds)
+
+
+def bench_pride_initiate_fight(size, density, seed):
+    world = make_world(size, density, seed, first_phase=True)
+    prides = [pride for pride in world.groups.of_type(Pride.name())
+              if len(pride.current_cell.groups[Pride.name()]) > 1]
+    return time_calls(lambda pride: None if pride.deleted else pride.initiate_fight(), prides)
+
+
+def bench_pride_hunt(size, density, seed):
+    world = make_world(size, density, seed, first_phase=True)
+    prides = [pride for pride in world.groups.of_type(Pride.name()) if pride.individuals]
+
+    def hunt(pride):
+        if pride.current_cell.population[Erbast.name()]:
+            pride.hunt()
+    return time_calls(hunt, prides)
+
+
+BENCHMARKS = {
+    "generate": bench_generate,
+    "live_day": bench_live_day,
+    "trigger_appeal_evaluation": bench_trigger_appeal_evaluation,
+    "get_best_cell_in_neighborhood": bench_get_best_cell_in_neighborhood,
+    "herd_join_all": bench_herd_join_all,
+    "pride_initiate_fight": bench_pride_initiate_fight,
+    "pride_hunt": bench_pride_hunt,
+}
+
+
+def result_key(result: dict) -> str:
+    return f"{result['benchmark']}/{result['size']}x{result['size']}/density={result['density']}"
+
+
+def run(benchmarks, sizes, densities, repeat: int = 3, seed: int = 0, log=sys.stderr) -> dict:
+    """
+    Run every benchmark at every size and density, repeat times, each time on a world generated from the
+    same seed.
+    :return: The results, with the seconds per call of the fastest and of the median repetition
+    """
+    results = []
+    for name in benchmarks:
+        for size in sizes:
+            # The world generated by bench_generate does not depend on the density
+            for density in (densities[:1] if name == "generate" else densities):
+                timings = []
+                for _ in range(repeat):
+                    calls, elapsed = BENCHMARKS[name](size, density, seed)
+                    timings.append(elapsed / calls if calls else 0.0)
+                result = {"benchmark": name, "size": size, "density": density, "calls": calls,
+                          "min": min(timings), "median": statistics.median(timings)}
+                results.append(result)
+                print(f"{result_key(result):<55}{calls:>9}{result['min'] * 1e6:>14.2f} us/call", file=log)
+    return {
+        "version": FORMAT_VERSION,
+        "seed": seed,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list:
+    """
+    Compare the fastest seconds per call of the benchmarks present in both runs.
+    :return: The (key, baseline, current, relative change, regression) rows, a regression being a slowdown
+             above threshold
+    """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = result_key(result)
+        if key not in baseline_results or baseline_results[key]["min"] == 0:
+            continue
+        before, after = baseline_results[key]["min"], result["min"]
+        change = after / before - 1
+        rows.append((key, before, after, change, change > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and compare benchmark runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    run_parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES),
+                            help="numbers of rows and columns of the square grids")
+    run_parser.add_argument("--densities", nargs="+", type=float, default=list(DENSITIES),
+                            help="erbasts and carvizes per ground cell")
+    run_parser.add_argument("--repeat", type=int, default=3, help="repetitions of each measurement")
+    run_parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    run_parser.add_argument("--output", default=None, help="write the results to this JSON file instead of stdout")
+
+    compare_parser = commands.add_parser("compare", help="flag the regressions between two runs")
+    compare_parser.add_argument("baseline", help="JSON results of the reference run")
+    compare_parser.add_argument("current", help="JSON results of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown above which a benchmark is a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.benchmarks, args.sizes, args.densities, args.repeat, args.seed)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    regressions = 0
+    print(f"{'benchmark':<55}{'baseline':>14}{'current':>14}{'change':>9}")
+    for key, before, after, change, regression in compare(baseline, current, args.threshold):
+        flag = "  REGRESSION" if regression else ""
+        regressions += regression
+        print(f"{key:<55}{before * 1e6:>11.2f} us{after * 1e6:>11.2f} us{change:>+9.1%}{flag}")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+On-disk cache of simulation results, addressed by a hash of everything that determines a run: the World
+options, the seed, the number of days, the constants and the source of the simulation modules.
+
+Each entry stores the daily population series of a run and, optionally, a checkpoint of its last day.
+The least recently used entries are evicted when the cache grows over its size limit.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import constants
+
+CACHE_VERSION = 1
+
+# Modules whose source decides the outcome of a run. checkpoint restores the order of the entity containers,
+# which decides how a continued run iterates, and headless fills the series of the quiescent days
+SIMULATION_MODULES = ("cells", "checkpoint", "config", "constants", "generation", "groups", "headless", "species",
+                      "tiled", "vectorized", "world")
+
+
+def code_fingerprint() -> str:
+    """Hash the source of the simulation modules, so that a change of the rules invalidates the cache."""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in SIMULATION_MODULES:
+        with open(os.path.join(directory, f"{module}.py"), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def run_key(config: dict) -> str:
+    """
+    Hash the configuration of a run, e.g. {"days": ..., "seed": ..., "engine": ..., "config": ...}.
+    :return: The hex digest naming the cache entry of the run
+    """
+    if config.get("seed") is None:
+        raise ValueError("Only seeded runs are reproducible and can be cached")
+    content = {
+        "version": CACHE_VERSION,
+        "config": config,
+        "constants": {name: getattr(constants, name) for name in dir(constants) if name.isupper()},
+        "code": code_fingerprint(),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def _save_series(path: str, species_names: list, counts: np.ndarray):
+    with open(path, "wb") as file:
+        np.savez(file, species=np.array(species_names), counts=counts)
+
+
+class ResultCache:
+    """
+    Directory of cached runs: <key>.series.npz holds the species names and a (days + 1, species) array of
+    counts, <key>.checkpoint.npz the optional checkpoint. Reading an entry marks it as recently used.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{key}.{kind}.npz")
+
+    def get(self, config: dict):
+        """:return: The (species names, counts) of the run, None if it is not cached"""
+        path = self._path(run_key(config), "series")
+        try:
+            with np.load(path) as archive:
+                species_names, counts = archive["species"].tolist(), archive["counts"]
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return species_names, counts
+
+    def checkpoint_path(self, config: dict) -> str | None:
+        """:return: The path of the checkpoint of the last day of the run, None if it is not cached"""
+        path = self._path(run_key(config), "checkpoint")
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, config: dict, species_names: list, counts: np.ndarray, world=None):
+        """Store the series of a run, and a checkpoint of world if given, then evict the oldest entries."""
+        key = run_key(config)
+        self._write(self._path(key, "series"), lambda path: _save_series(path, species_names, counts))
+        if world is not None:
+            self._write(self._path(key, "checkpoint"), world.save)
+        self.evict()
+
+    def _write(self, path: str, write):
+        # Writes through a temporary file, so that readers never see a partial entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(descriptor)
+        try:
+            write(temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits in max_bytes."""
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory) if entry.name.endswith(".npz"))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                os.unlink(entry.path)
@@ -1,33 +1,93 @@
-from constants import WATER_COLOR, GROUND_COLOR, NUMCELLS_R
+import heapq
 
+import numpy as np
+
+from constants import WATER_COLOR, GROUND_COLOR
+
+# Offsets of the eight neighbors of a cell, in the order in which they are scanned
+NEIGHBOR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+
+
+def compute_appeal(vegetebob_density, erbast_count, carviz_count):
+    """
+    Compute the erbast and carviz appeal from the content of a cell.
+    Works on scalars as well as on whole-grid arrays of densities and counts.
+
+    ASSUMPTION: Inspired by sid meier's civilization.
+    :return: The (erbast appeal, carviz appeal) pair
+    """
+    # Each point of vegetob's density adds 1 point of erbast appeal
+    # Each erbast's individual removes 10 points of prey appeal and adds 50 points for predator appeal
+    # Each carviz's individual removes 25 points from prey appeal and 10 from predator appeal
+    erbast_appeal = vegetebob_density - erbast_count * 10 - carviz_count * 25
+    carviz_appeal = erbast_count * 50 - carviz_count * 10
+    return erbast_appeal, carviz_appeal
 
-class Cell:
-    world = None
 
+def neighbor_table(rows: int, cols: int, topology: str = "bounded"):
+    """
+    Build the neighbor index of a rows x cols grid, where cell (x, y) has the flat index x * cols + y.
+    On a "bounded" grid the neighbors outside of the grid are invalid, on a "toroidal" grid they wrap around.
+    :return: A (rows*cols, 8) array of flat neighbor indices and the matching validity mask
+    """
+    x, y = np.divmod(np.arange(rows * cols), cols)
+    nx = x[:, None] + np.array([offset[0] for offset in NEIGHBOR_OFFSETS])
+    ny = y[:, None] + np.array([offset[1] for offset in NEIGHBOR_OFFSETS])
+    if topology == "toroidal":
+        nx %= rows
+        ny %= cols
+    valid = (nx >= 0) & (nx < rows) & (ny >= 0) & (ny < cols)
+    neighbors = np.where(valid, nx * cols + ny, 0)
+    return neighbors, valid
+
+
+def best_neighbor_indices(cells, appeal, walkable, neighbors, neighbors_valid):
+    """
+    Find the best cell to move to from each of the given cells in a single gather and argmax,
+    with the rules of Animal.get_best_cell_in_neighborhood: a walkable neighbor must beat the appeal of the
+    current cell by 50, and the last of the neighbors with the greatest appeal wins.
+    :return: The flat index of the best cell for each flat index in cells
+    """
+    candidates = neighbors[cells]
+    candidate_appeal = np.where(neighbors_valid[cells] & walkable[candidates], appeal[candidates], -np.inf)
+    rows = np.arange(len(cells))
+    best = candidate_appeal.shape[1] - 1 - np.argmax(candidate_appeal[:, ::-1], axis=1)
+    return np.where(candidate_appeal[rows, best] >= appeal[cells] + 50, candidates[rows, best], cells)
+
+
+class Cell:
     # Mapping of cell types to colors
     cell_type_handler = {
         "water": WATER_COLOR,
         "ground": GROUND_COLOR,
     }
 
-    def __init__(self, x, y, cell_type):
+    def __init__(self, x, y, cell_type, world):
         self.x = x
         self.y = y
+        self.world = world  # World the cell belongs to, several worlds can coexist in one process
         self.cell_type = cell_type  # water or ground
-        self.appeal = {
+        self.__appeal = {
             "carviz": 0,
             "erbast": 0
         }
+        self.appeal_dirty = False  # Whether the content changed since the last appeal evaluation
+        self.appeal_growth_day = None  # Growth day of the appeal while the vegetob grows, see appeal_outdated
+        self.neighborhood_epoch = 0  # Incremented on every change of the content of the cell or of a neighbor
+        self.best_neighbors = {}  # Memoized (epochs, best cell) of each species, see best_neighbor
+        self.erbast_heap = []  # (-energy, uid, erbast) entries, see index_erbast
+        self.erbast_heap_stale = 0  # Entries of the heap outdated since it was last rebuilt
+        # The entities and groups are held as keys of dicts, whose iteration follows the insertion order.
+        # Unlike a set, that order only depends on the insertions and removals, so a checkpoint restores it.
         self.population = {  # Population of species in the cell
-            "vegetebob": set(),
-            "erbast": set(),
-            "carviz": set(),
+            "vegetebob": {},
+            "erbast": {},
+            "carviz": {},
         }
         self.groups = {  # Social groups in the cell
-            "herd": set(),
-            "pride": set()
+            "herd": {},
+            "pride": {}
         }
-        self.__surrounding_cells = []  # Cache for surrounding cells
 
     def __int__(self):
         return self.cell_type_handler[self.cell_type]
@@ -35,53 +95,171 @@ class Cell:
     def __str__(self):
         return f"{self.cell_type}"
 
-    def trigger_appeal_evaluation(self) -> None:
+    @property
+    def appeal(self) -> dict:
         """
-        Evaluate the appeal of the cell based on the population of species in the cell.
-        The appeal determines the desirability of the cell for species movement.
+        The appeal of the cell for each animal species, evaluated lazily: it is only recomputed when read
+        after a change of the cell's content or the growth of its vegetob.
+        """
+        # Inlined appeal_outdated, the appeal is read for every neighbor of every moving group
+        if self.appeal_dirty or (self.appeal_growth_day is not None
+                                 and self.appeal_growth_day != self.world.growth_days):
+            self.trigger_appeal_evaluation()
+        return self.__appeal
 
-        ASSUMPTION: Inspired by sid meier's civilization.
+    def appeal_outdated(self) -> bool:
+        # Returns whether the content of the cell changed, or its vegetob grew, since the last appeal evaluation
+        return self.appeal_dirty or (self.appeal_growth_day is not None
+                                     and self.appeal_growth_day != self.world.growth_days)
+
+    def track_growth(self) -> None:
+        """
+        Record that the vegetob of the cell is below 100, e.g. after being grazed. The appeal keeps its value
+        until the vegetob grows, then it is evaluated again.
         """
+        if self.appeal_growth_day is None:
+            self.appeal_growth_day = self.world.growth_days
 
-        # Reset the appeal values
-        self.appeal["erbast"] = 0
-        self.appeal["carviz"] = 0
+    def mark_appeal_dirty(self) -> None:
+        """
+        Record that the content of the cell changed, so that its appeal is evaluated again before being read.
+        This also starts a new neighborhood epoch of the cell and of its neighbors, which invalidates the
+        memoized best neighbors that depend on its appeal.
+        """
+        self.neighborhood_epoch += 1
+        for cell in self.get_surrounding_cells():
+            cell.neighborhood_epoch += 1
+        if not self.appeal_dirty:
+            self.appeal_dirty = True
+            self.world.dirty_cells.append(self)
 
-        # Each point of vegetob's density adds 1 point of erbast appeal
-        if len(self.population["vegetebob"]) != 0:
-            vegetebob_elem = list(self.population["vegetebob"])[0]
-            self.appeal["erbast"] += vegetebob_elem.density
+    def update_activity(self) -> None:
+        """
+        Keep the world's indexes of active and awake cells in sync with the content of the cell: a cell is
+        active while it holds at least one entity, and awake while it is not quiescent.
+        """
+        if any(self.population.values()):
+            self.world.active_cells[self.index] = self
+        else:
+            self.world.active_cells.pop(self.index, None)
+        if self.is_quiescent():
+            self.world.awake_cells.pop(self.index, None)
+        else:
+            self.world.awake_cells[self.index] = self
 
-        # Each erbast's individual removes 10 points of prey appeal and adds 50 points for predator appeal
-        self.appeal["erbast"] -= len(self.population["erbast"]) * 10
-        self.appeal["carviz"] += len(self.population["erbast"]) * 50
+    def is_quiescent(self) -> bool:
+        """
+        Whether the first phase of a day leaves the cell unchanged: it holds no animal. The growth of a
+        vegetob is computed when its density is read, and Vegetebob.__overwhelm has no effect.
+        Neighbors cannot change the cell without moving an animal into it, which wakes it up.
+        """
+        return not (self.population["erbast"] or self.population["carviz"])
 
-        # Each carviz's individual removes 25 points from prey appeal and 10 from predator appeal
-        self.appeal["erbast"] -= len(self.population["carviz"]) * 25
-        self.appeal["carviz"] -= len(self.population["carviz"]) * 10
+    def vegetebob_density(self):
+        # Returns the density of the cell's vegetob, 0 if there is none
+        for vegetebob in self.population["vegetebob"]:
+            return vegetebob.density
+        return 0
+
+    def trigger_appeal_evaluation(self) -> None:
+        """
+        Evaluate the appeal of the cell based on the population of species in the cell.
+        The appeal determines the desirability of the cell for species movement.
+        """
+        self.set_appeal(*compute_appeal(self.vegetebob_density(), len(self.population["erbast"]),
+                                        len(self.population["carviz"])))
+
+    def set_appeal(self, erbast_appeal, carviz_appeal) -> None:
+        # Stores an evaluated appeal, e.g. one computed for the whole grid at once
+        self.__appeal["erbast"] = erbast_appeal
+        self.__appeal["carviz"] = carviz_appeal
+        self.appeal_dirty = False
+        # While the vegetob grows, the appeal only holds for the current growth day
+        growing = self.population["vegetebob"] and self.vegetebob_density() < 100
+        self.appeal_growth_day = self.world.growth_days if growing else None
+        if self.world.profiler is not None:
+            self.world.profiler.count("appeal_evaluations")
 
     @classmethod
     def available_cell_types(cls):
         # Returns a list of available cell types
         return list(cls.cell_type_handler.keys())
 
-    @classmethod
-    def assign_to_world(cls, world):
-        # Assigns the world object to the Cell class
-        cls.world = world
+    @property
+    def index(self) -> int:
+        # Returns the flat index of the cell in the world's neighbor table
+        return self.x * self.world.cols + self.y
+
+    def get_surrounding_cells(self):
+        # Returns the surrounding cells of the current cell, from the world's neighbor table
+        return self.world.surrounding_cells[self.index]
+
+    def index_erbast(self, erbast, replaced: bool = False) -> None:
+        """
+        Record the current energy of an erbast of the cell in the energy-ordered heap of the cell.
+        Must be called whenever an erbast enters the cell or its energy changes, see unindex_erbast for the
+        erbasts that leave it. Outdated entries are dropped when they reach the top of the heap, or all at
+        once when they make up more than half of it.
+        :param replaced: Whether the energy of the erbast changed, which outdates its previous entry
+        """
+        heapq.heappush(self.erbast_heap, (-erbast.energy, erbast.uid, erbast))
+        if replaced:
+            self.erbast_heap_stale += 1
+            self._compact_erbast_heap()
 
-    def __get_surrounding_coordinates(self):
-        # Returns a list of eight neighboring coordinates in a 2D grid
-        x = self.x
-        y = self.y
+    def unindex_erbast(self, erbast) -> None:
+        # Records that an erbast left the cell or died, which outdates its entry in the heap
+        self.erbast_heap_stale += 1
+        self._compact_erbast_heap()
 
-        surrounding_coordinates = [(nx, ny) for nx in range(x - 1, x + 2) for ny in range(y - 1, y + 2)
-                                   if 0 <= nx < NUMCELLS_R and 0 <= ny < NUMCELLS_R and (nx, ny) != (x, y)]
-        return surrounding_coordinates
+    def _compact_erbast_heap(self) -> None:
+        # Rebuilds the heap when outdated entries dominate it, so it does not keep departed or dead erbasts alive
+        heap = self.erbast_heap
+        if not self.population["erbast"]:
+            heap.clear()
+            self.erbast_heap_stale = 0
+        elif 2 * self.erbast_heap_stale > len(heap):
+            heap[:] = [(-other.energy, other.uid, other) for other in self.population["erbast"]]
+            heapq.heapify(heap)
+            self.erbast_heap_stale = 0
 
-    def get_surrounding_cells(self):
-        # Returns the surrounding cells of the current cell
-        if len(self.__surrounding_cells) == 0:
-            self.__surrounding_cells = [self.world.cells_grid[coord[0], coord[1]] for coord in
-                                        self.__get_surrounding_coordinates()]
-        return self.__surrounding_cells
+    def strongest_erbast(self):
+        """
+        Get the erbast with the most energy in the cell, the oldest one among equals, in O(log n).
+        :return: The Erbast, None if the cell has none
+        """
+        heap = self.erbast_heap
+        while heap:
+            negative_energy, _, erbast = heap[0]
+            if erbast.current_cell is self and not erbast.deleted and erbast.energy == -negative_energy:
+                return erbast
+            heapq.heappop(heap)  # The erbast left the cell, died or changed its energy since this entry
+            self.erbast_heap_stale = max(self.erbast_heap_stale - 1, 0)
+        return None
+
+    def best_neighbor(self, species: str):
+        """
+        Get the cell that an individual of the given species in this cell moves to, see
+        Animal.get_best_cell_in_neighborhood. The result is memoized until the content of the cell or of one
+        of its neighbors changes, or a new day grows the vegetobs, so all the members of a group, and the
+        group itself, share one scan of the neighborhood.
+        :return: The Cell object with the greatest appeal for the given species
+        """
+        epoch = (self.world.appeal_epoch, self.neighborhood_epoch)
+        memo = self.best_neighbors.get(species)
+        if memo is not None and memo[0] == epoch:
+            return memo[1]
+
+        best_cell = self
+        for cell in self.get_surrounding_cells():
+            # Animals prefer to stay in the current cell due to energy, therefore it needs 50 more appeal
+            if best_cell is self:
+                best_cell_appeal = best_cell.appeal[species] + 50
+            else:
+                best_cell_appeal = best_cell.appeal[species]
+
+            if cell.appeal[species] >= best_cell_appeal and cell.cell_type != "water":
+                best_cell = cell
+
+        self.best_neighbors[species] = (epoch, best_cell)
+        return best_cell
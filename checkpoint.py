@@ -0,0 +1,229 @@
+"""
+Binary checkpoints of a World: an uncompressed .npz archive of columnar arrays plus a small JSON header.
+
+The object engine is stored as per-cell arrays (terrain, appeal), one row per vegetob (uid, cell, density),
+one row per animal (uid, species, cell, attributes, group) and one row per group of the world's GroupRegistry,
+in order. The rank columns keep the position of each row in the ordered containers of its cell and group.
+Restoring rebuilds the object graph directly, without the entity constructors and their bookkeeping.
+"""
+import json
+
+import numpy as np
+
+from cells import Cell
+from config import SimulationConfig
+from groups import Herd, Pride
+from species import Vegetebob, Erbast, Carviz
+from vectorized import VectorizedEngine, ANIMAL_COLUMNS
+
+FORMAT_VERSION = 4
+
+# Codes of the classes in the species and group columns
+ANIMAL_CLASSES = (Erbast, Carviz)
+GROUP_CLASSES = (Herd, Pride)
+
+
+def save_world(world, path):
+    """Write the state of the world and of its random generators to path."""
+    header = {
+        "version": FORMAT_VERSION,
+        "rows": world.rows,
+        "cols": world.cols,
+        "engine": world.engine,
+        "appeal_evaluation": world.appeal_evaluation,
+        "topology": world.topology,
+        "terrain": world.terrain,
+        "config": world.config.as_dict(),
+        "day": world.day,
+    }
+    if world.engine == "object":
+        arrays = _object_arrays(world)
+    elif world.engine == "vectorized":
+        arrays = _vectorized_arrays(world.array_engine)
+    else:
+        raise ValueError(f"Checkpoints of the {world.engine} engine are not supported")
+
+    random_version, random_internal_state, random_gauss_next = world.random.getstate()
+    header["random"] = {"version": random_version, "gauss_next": random_gauss_next}
+    header["rng"] = world.rng.bit_generator.state
+    header["next_uid"] = world.next_uid
+    arrays["random_state"] = np.array(random_internal_state, dtype=np.uint64)
+
+    with open(path, "wb") as file:
+        np.savez(file, header=np.array(json.dumps(header)), **arrays)
+
+
+def load_world(world_class, path, restore_random_state: bool = True):
+    """
+    Read a checkpoint written by save_world.
+    :return: A new instance of world_class, ready to continue with live_day
+    """
+    with np.load(path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    header = json.loads(arrays.pop("header").item())
+    if header["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {header['version']}")
+
+    world = world_class(header["rows"], header["cols"], engine=header["engine"],
+                        appeal_evaluation=header["appeal_evaluation"], topology=header["topology"],
+                        terrain=header.get("terrain", "random"),
+                        config=SimulationConfig(**header["config"]) if "config" in header else None)
+    if world.engine == "object":
+        restore_objects(world, arrays)
+    else:
+        _restore_vectorized(world, arrays)
+    world.restart_telemetry(header["day"])
+
+    world.next_uid = max(world.next_uid, header["next_uid"])
+    if restore_random_state:
+        world.random.setstate((header["random"]["version"],
+                               tuple(int(value) for value in arrays["random_state"]), header["random"]["gauss_next"]))
+        # The array engine shares the Generator of the world
+        world.rng.bit_generator.state = header["rng"]
+    return world
+
+
+def _vectorized_arrays(engine) -> dict:
+    arrays = {"ground": engine.ground, "has_vegetebob": engine.has_vegetebob, "density": engine.density,
+              "next_group": np.array(engine._next_group)}
+    arrays.update({f"animal_{column}": getattr(engine, column) for column in ANIMAL_COLUMNS})
+    return arrays
+
+
+def _restore_vectorized(world, arrays: dict):
+    engine = world.array_engine = VectorizedEngine(world.rows, world.cols, world.topology, world.rng,
+                                                         world.config)
+    engine.ground = arrays["ground"]
+    engine.has_vegetebob = arrays["has_vegetebob"]
+    engine.density = arrays["density"]
+    engine._clear_animals()
+    engine._append({column: arrays[f"animal_{column}"] for column in ANIMAL_COLUMNS})
+    engine._next_group = int(arrays["next_group"])
+
+
+def _object_arrays(world) -> dict:
+    # Evaluating the pending appeals now gives the values they would get when next read
+    world.evaluate_dirty_cells()
+    cells = world.cells_grid.ravel()
+    groups = list(world.groups)
+    group_index = {group: index for index, group in enumerate(groups)}
+    vegetebobs = list(world.population[Vegetebob.name()])
+    animals = [animal for animal_class in ANIMAL_CLASSES for animal in world.population[animal_class.name()]]
+    # Positions of the entities and groups in the ordered containers of their cell and group
+    cell_rank, group_rank = {}, {}
+    for cell in cells:
+        for entities in (*cell.population.values(), *cell.groups.values()):
+            cell_rank.update((entity, rank) for rank, entity in enumerate(entities))
+    for group in groups:
+        group_rank.update((animal, rank) for rank, animal in enumerate(group.individuals))
+
+    return {
+        "ground": np.array([cell.cell_type == "ground" for cell in cells], dtype=bool),
+        "appeal": np.array([(cell.appeal["erbast"], cell.appeal["carviz"]) for cell in cells],
+                           dtype=np.float64).reshape(-1, 2),
+        "vegetebob_uid": np.array([vegetebob.uid for vegetebob in vegetebobs], dtype=np.int64),
+        "vegetebob_cell": np.array([vegetebob.current_cell.index for vegetebob in vegetebobs], dtype=np.int64),
+        "vegetebob_density": np.array([vegetebob.density for vegetebob in vegetebobs], dtype=np.float64),
+        "vegetebob_cell_rank": np.array([cell_rank[vegetebob] for vegetebob in vegetebobs], dtype=np.int64),
+        "animal_uid": np.array([animal.uid for animal in animals], dtype=np.int64),
+        "animal_species": np.array([ANIMAL_CLASSES.index(type(animal)) for animal in animals], dtype=np.int8),
+        "animal_cell": np.array([animal.current_cell.index for animal in animals], dtype=np.int64),
+        "animal_energy": np.array([animal.energy for animal in animals], dtype=np.float64),
+        "animal_lifetime": np.array([animal.lifetime for animal in animals], dtype=np.int64),
+        "animal_age": np.array([animal.age for animal in animals], dtype=np.int64),
+        "animal_social_attitude": np.array([animal.social_attitude for animal in animals], dtype=np.float64),
+        "animal_group": np.array([group_index.get(animal.current_group, -1) for animal in animals],
+                                 dtype=np.int64),
+        "animal_cell_rank": np.array([cell_rank[animal] for animal in animals], dtype=np.int64),
+        "animal_group_rank": np.array([group_rank.get(animal, 0) for animal in animals], dtype=np.int64),
+        "group_uid": np.array([group.uid for group in groups], dtype=np.int64),
+        "group_type": np.array([GROUP_CLASSES.index(type(group)) for group in groups], dtype=np.int8),
+        "group_cell": np.array([group.current_cell.index for group in groups], dtype=np.int64),
+        "group_cell_rank": np.array([cell_rank[group] for group in groups], dtype=np.int64),
+        "group_total_energy": np.array([group.total_energy for group in groups], dtype=np.float64),
+    }
+
+
+def restore_objects(world, arrays: dict):
+    """
+    Rebuild the cells, groups and entities of the object engine from columnar arrays, see _object_arrays.
+    Every ordered container is refilled in the order it had when saved, so the restored world iterates over
+    its entities and groups, and continues, exactly like the saved one.
+    """
+    world._reset()
+    cells = []
+    for index, ground in enumerate(arrays["ground"].tolist()):
+        cell = Cell(x=index // world.cols, y=index % world.cols, cell_type="ground" if ground else "water",
+                    world=world)
+        cells.append(cell)
+    world.cells_grid.ravel()[:] = cells
+    world._link_surrounding_cells()
+
+    groups = []
+    for uid, group_type, cell_index, total_energy in zip(
+            *(arrays[f"group_{column}"].tolist() for column in ("uid", "type", "cell", "total_energy"))):
+        group = GROUP_CLASSES[group_type].__new__(GROUP_CLASSES[group_type])
+        group.uid = uid
+        group.deleted = False
+        group.individuals = {}
+        # The running sum is restored as is, summing the energies again could round differently
+        group.total_energy = total_energy
+        group.current_cell = cells[cell_index]
+        world.groups.add(group)
+        groups.append(group)
+    for position in _rank_order(arrays["group_cell_rank"]):
+        group = groups[position]
+        group.current_cell.groups[group.name()][group] = None
+
+    vegetebobs = []
+    for uid, cell_index, density in zip(arrays["vegetebob_uid"].tolist(), arrays["vegetebob_cell"].tolist(),
+                                        arrays["vegetebob_density"].tolist()):
+        vegetebob = Vegetebob.__new__(Vegetebob)
+        vegetebob.uid = uid
+        vegetebob.current_cell = cells[cell_index]
+        vegetebob.density = density
+        vegetebob.surrounding_vegetebobs = None
+        world.population[Vegetebob.name()][vegetebob] = None
+        vegetebobs.append(vegetebob)
+    for position in _rank_order(arrays["vegetebob_cell_rank"]):
+        vegetebob = vegetebobs[position]
+        vegetebob.current_cell.population[Vegetebob.name()][vegetebob] = None
+
+    animals = []
+    for uid, species, cell_index, energy, lifetime, age, social_attitude, group_index in zip(
+            *(arrays[f"animal_{column}"].tolist() for column in
+              ("uid", "species", "cell", "energy", "lifetime", "age", "social_attitude", "group"))):
+        animal_class = ANIMAL_CLASSES[species]
+        animal = animal_class.__new__(animal_class)
+        animal.uid = uid
+        animal.deleted = False
+        animal.current_cell = cells[cell_index]
+        animal.current_group = groups[group_index] if group_index >= 0 else None
+        animal.energy = energy
+        animal.lifetime = lifetime
+        animal.age = age
+        animal.social_attitude = social_attitude
+        world.population[animal_class.name()][animal] = None
+        animals.append(animal)
+    for position in _rank_order(arrays["animal_cell_rank"]):
+        animal = animals[position]
+        animal.current_cell.population[animal.name()][animal] = None
+        animal._entered_cell()
+    for position in _rank_order(arrays["animal_group_rank"]):
+        animal = animals[position]
+        if animal.current_group is not None:
+            animal.current_group.individuals[animal] = None
+
+    # The appeals are set once the vegetobs are in place, to know whether they still grow
+    for cell, (erbast_appeal, carviz_appeal) in zip(cells, arrays["appeal"].tolist()):
+        cell.set_appeal(erbast_appeal, carviz_appeal)
+
+    # New entities and groups get uids after the restored ones
+    world.next_uid = 1 + max(int(arrays[f"{kind}_uid"].max(initial=-1)) for kind in ("group", "vegetebob", "animal"))
+    world.active_cells = {cell.index: cell for cell in cells if any(cell.population.values())}
+    world.awake_cells = {cell.index: cell for cell in cells if not cell.is_quiescent()}
+
+
+def _rank_order(ranks: np.ndarray) -> list:
+    # Returns the rows in the order that fills every container by rank, rows of equal rank keep their order
+    return np.argsort(ranks, kind="stable").tolist()
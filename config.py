@@ -0,0 +1,30 @@
+from dataclasses import dataclass, asdict, replace
+
+from constants import (NUMCELLS_R, NUMCELLS_C, MAX_VEGETOBOB, MAX_ERBAST, MAX_CARVIZ, MAX_GROUP, MAX_ENERGY,
+                       MAX_LIFE, AGING, GROWING)
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    """
+    Sizes, caps and rates of a simulation, defaulting to the values of constants.py.
+    Every World reads them from its own configuration, so worlds with different parameters can coexist in
+    one process.
+    """
+    rows: int = NUMCELLS_R
+    cols: int = NUMCELLS_C
+    max_vegetebob: int = MAX_VEGETOBOB  # caps of the populations spawned by generate
+    max_erbast: int = MAX_ERBAST
+    max_carviz: int = MAX_CARVIZ
+    max_group: int = MAX_GROUP  # groups of this size no longer spawn offspring
+    max_energy: int = MAX_ENERGY  # maximum initial energy
+    max_life: int = MAX_LIFE  # maximum lifetime
+    aging: float = AGING  # energy lost every 10 days
+    growing: float = GROWING  # vegetob density that grows per day
+
+    def replace(self, **changes) -> "SimulationConfig":
+        # Returns a copy of the configuration with some parameters changed
+        return replace(self, **changes)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
@@ -0,0 +1,123 @@
+"""
+Ensemble runner: simulate many independently seeded replicates of the same configuration on a process pool
+and aggregate their daily population counts.
+
+Usage: python ensemble.py --replicates 200 --days 1000 --csv ensemble.csv
+"""
+import argparse
+import csv
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from constants import NUMCELLS_R, NUMCELLS_C
+from headless import simulate
+from world import World
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# The workers of a Pool are daemonic and may not start the processes of the tiled engine, and the
+# replicates already use every core
+ENSEMBLE_ENGINES = tuple(engine for engine in World.available_engines if engine != "tiled")
+
+
+def _run_replicate(arguments):
+    """
+    Run one replicate in a worker process.
+    Only the population series goes back to the parent, never the World itself.
+    :return: The replicate index, the species names and a (days + 1, species) array of counts
+    """
+    index, seed, days, rows, cols, engine = arguments
+    series = []
+    species_names = None
+    for day, population_counts in simulate(days, seed, rows, cols, engine):
+        species_names = list(population_counts.keys())
+        series.append(list(population_counts.values()))
+    return index, species_names, np.array(series, dtype=np.int32)
+
+
+def aggregate(series: np.ndarray, species_names: list, quantiles=DEFAULT_QUANTILES) -> dict:
+    """
+    Aggregate the population series of several replicates.
+    :param series: A (replicates, days + 1, species) array of counts
+    :return: For each species a dict with the per-day "mean", the per-day "quantiles" as a
+        (len(quantiles), days + 1) array, the "extinction_day" of each replicate (-1 if it survived)
+        and the fraction of replicates that went "extinct"
+    """
+    statistics = {}
+    for s, species in enumerate(species_names):
+        counts = series[:, :, s]
+        extinct = counts == 0
+        extinction_day = np.where(extinct.any(axis=1), extinct.argmax(axis=1), -1)
+        statistics[species] = {
+            "mean": counts.mean(axis=0),
+            "quantiles": np.quantile(counts, quantiles, axis=0),
+            "extinction_day": extinction_day,
+            "extinct": float(np.mean(extinction_day >= 0)),
+        }
+    return statistics
+
+
+def iter_ensemble(replicates: int, days: int, seed: int = 0, rows: int = NUMCELLS_R, cols: int = NUMCELLS_C,
+                  engine: str = "object", processes: int | None = None, quantiles=DEFAULT_QUANTILES):
+    """
+    Run the replicates with seeds seed, seed + 1, ... on a pool of processes, one per core by default.
+    :return: A generator yielding (number of finished replicates, aggregated statistics) each time a
+        replicate finishes, so that partial results can be looked at while the others are running
+    """
+    if engine not in ENSEMBLE_ENGINES:
+        raise ValueError(f"Unknown ensemble engine {engine!r}, expected one of {ENSEMBLE_ENGINES}")
+    tasks = [(index, seed + index, days, rows, cols, engine) for index in range(replicates)]
+    series = np.zeros((replicates, days + 1, 0), dtype=np.int32)
+    finished = np.zeros(replicates, dtype=bool)
+
+    with Pool(processes) as pool:
+        for index, species_names, replicate_series in pool.imap_unordered(_run_replicate, tasks):
+            if series.shape[2] == 0:
+                series = np.zeros((replicates, days + 1, len(species_names)), dtype=np.int32)
+            series[index] = replicate_series
+            finished[index] = True
+            yield int(finished.sum()), aggregate(series[finished], species_names, quantiles)
+
+
+def run_ensemble(replicates: int, days: int, **kwargs) -> dict:
+    """Run the whole ensemble and return the aggregated statistics of all replicates, see iter_ensemble."""
+    statistics = {}
+    for _, statistics in iter_ensemble(replicates, days, **kwargs):
+        pass
+    return statistics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many seeded replicates and aggregate their populations.")
+    parser.add_argument("--replicates", type=int, default=10, help="number of replicates")
+    parser.add_argument("--days", type=int, default=100, help="number of days to simulate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replicate")
+    parser.add_argument("--rows", type=int, default=NUMCELLS_R, help="number of rows of the grid")
+    parser.add_argument("--cols", type=int, default=NUMCELLS_C, help="number of columns of the grid")
+    parser.add_argument("--engine", choices=ENSEMBLE_ENGINES, default="object")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--csv", default=None, help="write the statistics to this CSV file instead of stdout")
+    args = parser.parse_args(argv)
+
+    statistics = {}
+    for finished, statistics in iter_ensemble(args.replicates, args.days, seed=args.seed, rows=args.rows,
+                                              cols=args.cols, engine=args.engine, processes=args.processes):
+        print(f"{finished}/{args.replicates} replicates finished", file=sys.stderr)
+
+    output = open(args.csv, "w", newline="") if args.csv else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(["species", "day", "mean", *(f"q{q:g}" for q in DEFAULT_QUANTILES), "extinct"])
+        for species, species_statistics in statistics.items():
+            for day in range(args.days + 1):
+                writer.writerow([species, day, species_statistics["mean"][day],
+                                 *species_statistics["quantiles"][:, day], species_statistics["extinct"]])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Offscreen export: simulate a World without any display and render the map and the population graph every k
+days with the non-interactive Agg canvas. Each frame is streamed to an image sequence or to an ffmpeg pipe
+as soon as it is drawn, so no frame is kept in memory.
+
+Usage: python export.py --days 10000 --every 10 --output frames/day_%06d.png
+       python export.py --days 10000 --every 10 --output run.mp4 --fps 30
+"""
+import argparse
+import os
+import shutil
+import subprocess
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+
+from world import World
+from constants import NUMCELLS_R, NUMCELLS_C
+from simulation_thread import DaySnapshot
+from visualization import MapRenderer, PopulationGraph
+
+
+class ImageSequenceWriter:
+    """
+    Write each frame to its own image file, named from a printf-style pattern such as day_%06d.png filled
+    with the day of the frame.
+    """
+
+    def __init__(self, pattern: str):
+        if "%" not in pattern:
+            raise ValueError("The pattern of an image sequence must contain a frame number, e.g. day_%06d.png")
+        self.pattern = pattern
+        self.frames = 0
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame: np.ndarray, day: int):
+        imsave(self.pattern % day, frame)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+
+class FFmpegWriter:
+    """Pipe the raw RGBA frames to an ffmpeg process that encodes them into a video file."""
+
+    def __init__(self, path: str, width: int, height: int, fps: int = 30, ffmpeg: str = "ffmpeg"):
+        executable = shutil.which(ffmpeg)
+        if executable is None:
+            raise ValueError(f"{ffmpeg} was not found, export to an image sequence instead")
+        self.frames = 0
+        self.process = subprocess.Popen(
+            [executable, "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+             # Most encoders need even dimensions
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path],
+            stdin=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray, day: int):
+        self.process.stdin.write(frame.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+
+
+class FrameExporter:
+    """
+    Render the map and the population graph of a world on an offscreen figure, with the same artists as
+    SimulationUI, and hand each frame to a writer. The writer may be attached after construction, e.g. once
+    it is sized from frame_size().
+    """
+
+    def __init__(self, world: World, writer=None, figsize: tuple = (10, 5), dpi: int = 100):
+        self.world = world
+        self.writer = writer
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax_graph, ax_map = self.figure.subplots(nrows=1, ncols=2)
+        self.figure.subplots_adjust(wspace=0.1)
+
+        snapshot = DaySnapshot(world, with_terrain=True)
+        self.map_renderer = MapRenderer(ax_map, snapshot)
+        self.population_graph = PopulationGraph(ax_graph, snapshot)
+
+    def frame_size(self) -> tuple:
+        """:return: The (width, height) of the frames in pixels"""
+        return self.canvas.get_width_height()
+
+    def export_frame(self):
+        snapshot = DaySnapshot(self.world)
+        self.map_renderer.update(snapshot)
+        self.population_graph.update(snapshot)
+        self.canvas.draw()
+        self.writer.write(np.asarray(self.canvas.buffer_rgba()), snapshot.day)
+
+    def run(self, days: int, every: int = 1) -> int:
+        """
+        Live the given number of days, exporting the current day first and then one frame every `every` days.
+        :return: The number of frames written
+        """
+        if every < 1:
+            raise ValueError("Frames must be exported at least every day")
+        self.export_frame()
+        for day in range(1, days + 1):
+            self.world.live_day()
+            if day % every == 0:
+                self.export_frame()
+        return self.writer.frames
+
+
+def export(world: World, days: int, output: str, every: int = 1, fps: int = 30, dpi: int = 100) -> int:
+    """
+    Export a run of a generated world to output: an image sequence if it contains a % pattern, a video
+    encoded by ffmpeg otherwise.
+    :return: The number of frames written
+    """
+    exporter = FrameExporter(world, dpi=dpi)
+    if "%" in output:
+        exporter.writer = ImageSequenceWriter(output)
+    else:
+        # The canvas rounds the size of the figure, so the video is sized from the frames it draws
+        exporter.writer = FFmpegWriter(output, *exporter.frame_size(), fps)
+    try:
+        return exporter.run(days, every)
+    finally:
+        exporter.writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a run of the simulation to images or a video.")
+    parser.add_argument("--days", type=int, default=1000, help="number of days to simulate")
+    parser.add_argument("--every", type=int, default=1, help="export one frame every this many days")
+    parser.add_argument("--output", required=True,
+                        help="image sequence pattern such as frames/day_%%06d.png, or a video file for ffmpeg")
+    parser.add_argument("--fps", type=int, default=30, help="frame rate of the video")
+    parser.add_argument("--dpi", type=int, default=100, help="resolution of the frames")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random generators of the world")
+    parser.add_argument("--rows", type=int, default=NUMCELLS_R, help="number of rows of the grid")
+    parser.add_argument("--cols", type=int, default=NUMCELLS_C, help="number of columns of the grid")
+    parser.add_argument("--engine", choices=World.available_engines, default="object")
+    args = parser.parse_args(argv)
+
+    world = World(args.rows, args.cols, engine=args.engine, seed=args.seed)
+    world.generate()
+    try:
+        frames = export(world, args.days, args.output, args.every, args.fps, args.dpi)
+    finally:
+        world.close()
+    print(f"{frames} frames written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
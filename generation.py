@@ -0,0 +1,141 @@
+"""
+Bulk generation of the initial state of a world: terrain, spawn assignments and animal attributes are drawn
+in whole-array operations from a seeded numpy Generator, in the columnar layout of VectorizedEngine.
+"""
+import numpy as np
+
+from config import SimulationConfig
+
+# Terrains of generate_terrain: a coin flip per cell, or continents and lakes of smooth noise
+TERRAINS = ("random", "noise")
+
+# Codes of the spawned species in the result of draw_capped_species, in the order of their caps
+VEGETEBOB, ERBAST, CARVIZ = 0, 1, 2
+
+
+def make_rng(seed: int | None = None) -> np.random.Generator:
+    """
+    Return a Generator for a generation. Without a seed, it is seeded from the global numpy generator, so
+    that np.random.seed still makes the whole run reproducible.
+    """
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
+    return np.random.default_rng(seed)
+
+
+def noise_field(rows: int, cols: int, rng: np.random.Generator, scale: float = 16.0, octaves: int = 4,
+                persistence: float = 0.5) -> np.ndarray:
+    """
+    Fractal value noise: the sum of octaves of random lattices, each twice as fine and `persistence` times
+    as strong as the previous one, smoothly interpolated between the lattice points.
+    :param scale: The size in cells of the features of the first octave
+    :return: A rows x cols array of noise values
+    """
+    field = np.zeros((rows, cols))
+    amplitude = 1.0
+    for octave in range(octaves):
+        size = max(scale / 2 ** octave, 1.0)
+        lattice = rng.random((int(rows / size) + 2, int(cols / size) + 2))
+        x = np.arange(rows) / size
+        y = np.arange(cols) / size
+        x0, y0 = x.astype(np.int64), y.astype(np.int64)
+        # Smoothstep weights hide the lattice edges
+        wx = (x - x0) ** 2 * (3 - 2 * (x - x0))
+        wy = (y - y0) ** 2 * (3 - 2 * (y - y0))
+        top = lattice[x0][:, y0] * (1 - wy) + lattice[x0][:, y0 + 1] * wy
+        bottom = lattice[x0 + 1][:, y0] * (1 - wy) + lattice[x0 + 1][:, y0 + 1] * wy
+        field += amplitude * (top * (1 - wx[:, None]) + bottom * wx[:, None])
+        amplitude *= persistence
+    return field
+
+
+def generate_terrain(rows: int, cols: int, rng: np.random.Generator, terrain: str = "random",
+                     ground_fraction: float = 0.5, scale: float = 16.0, topology: str = "bounded") -> np.ndarray:
+    """
+    Draw the terrain of the grid, water on the boundary of a bounded grid. A toroidal grid has no boundary,
+    its edge cells are drawn like the others so that the animals can wrap around onto land.
+    With the "noise" terrain, the highest ground_fraction of the noise field is ground.
+    :return: A flat boolean array, True for ground cells
+    """
+    if terrain not in TERRAINS:
+        raise ValueError(f"Unknown terrain {terrain!r}, expected one of {TERRAINS}")
+    if topology == "toroidal":
+        boundary = np.zeros(rows * cols, dtype=bool)
+    else:
+        x, y = np.divmod(np.arange(rows * cols), cols)
+        boundary = (x == 0) | (x == rows - 1) | (y == 0) | (y == cols - 1)
+    if terrain == "random":
+        return ~boundary & (rng.random(rows * cols) < ground_fraction)
+
+    field = noise_field(rows, cols, rng, scale).ravel()
+    if boundary.all():
+        return ~boundary
+    level = np.quantile(field[~boundary], 1 - ground_fraction)
+    return ~boundary & (field > level)
+
+
+def draw_capped_species(n: int, caps: list, rng: np.random.Generator) -> np.ndarray:
+    """
+    Choose a species for each of n cells in scan order, dropping a species from the choice once its count
+    exceeds its cap, i.e. like the original cell by cell generation.
+    :return: An array with the chosen species index per cell, -1 where nothing can be spawned
+    """
+    chosen = np.full(n, -1, dtype=np.int64)
+    counts = np.zeros(len(caps), dtype=np.int64)
+    available = list(range(len(caps)))
+    start = 0
+    while start < n and available:
+        draws = np.array(available)[rng.integers(0, len(available), size=n - start)]
+        # Find the first draw after which one of the species is no longer available
+        stop = n - start
+        for species in available:
+            running = counts[species] + np.cumsum(draws == species)
+            over = np.flatnonzero(running > caps[species])
+            if len(over) > 0:
+                stop = min(stop, over[0] + 1)
+        chosen[start:start + stop] = draws[:stop]
+        counts += np.bincount(draws[:stop], minlength=len(caps))
+        available = [species for species in available if counts[species] <= caps[species]]
+        start += stop
+    return chosen
+
+
+def spawn_columns(cells: np.ndarray, species: np.ndarray, rng: np.random.Generator,
+                  config: SimulationConfig = SimulationConfig()) -> dict:
+    """
+    Draw the attributes of newborn animals, one per entry of cells, with the ranges of Animal.__init__.
+    :return: The columns of the animals, see vectorized.ANIMAL_COLUMNS
+    """
+    n = len(cells)
+    return {
+        "species": species.astype(np.int8),
+        "energy": rng.integers(1, config.max_energy + 1, size=n).astype(np.float64),
+        "lifetime": rng.integers(1, config.max_life + 1, size=n),
+        "age": np.zeros(n, dtype=np.int64),
+        "social_attitude": rng.uniform(0, 1, size=n),
+        "cell": cells.astype(np.int64),
+        "group": np.full(n, -1, dtype=np.int64),
+    }
+
+
+def generate_state(rows: int, cols: int, rng: np.random.Generator, terrain: str = "random",
+                   config: SimulationConfig = SimulationConfig(), topology: str = "bounded") -> dict:
+    """
+    Generate the terrain and spawn one species per ground cell, in scan order and within the caps of config.
+    Animal species are coded like VectorizedEngine.species (0 for erbast, 1 for carviz).
+    :return: A dict with the per-cell "ground", "has_vegetebob" and "density" arrays and the "animals" columns
+    """
+    ground = generate_terrain(rows, cols, rng, terrain, topology=topology)
+    ground_cells = np.flatnonzero(ground)
+    spawned = draw_capped_species(len(ground_cells), [config.max_vegetebob, config.max_erbast, config.max_carviz],
+                                  rng)
+
+    has_vegetebob = np.zeros(rows * cols, dtype=bool)
+    has_vegetebob[ground_cells[spawned == VEGETEBOB]] = True
+    animal = (spawned == ERBAST) | (spawned == CARVIZ)
+    return {
+        "ground": ground,
+        "has_vegetebob": has_vegetebob,
+        "density": np.where(has_vegetebob, 5.0, 0.0),
+        "animals": spawn_columns(ground_cells[animal], spawned[animal] - ERBAST, rng, config),
+    }
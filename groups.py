@@ -1,30 +1,76 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 
-from random import choices
+from profiling import profiled
 
 if TYPE_CHECKING:
     from species import Animal, Erbast, Carviz  # Importing type hints for type checking
     from cells import Cell
 
 
+class GroupRegistry:
+    """
+    The groups of a world, by group type, in creation order.
+
+    Removing a group only counts it: the group is already flagged deleted and is skipped by the iterations,
+    so a daily pass can go on while fights and joins delete groups. compact() drops the removed groups
+    between days, which keeps both operations O(1) per group.
+    """
+
+    def __init__(self):
+        self.groups = {}  # List of the groups of each type, by group name
+        self.removed = 0  # Deleted groups still held by the lists
+
+    def add(self, group):
+        self.groups.setdefault(group.name(), []).append(group)
+
+    def remove(self, group):
+        self.removed += 1
+
+    def of_type(self, name: str):
+        """Iterate over the live groups of one type, including those created during the iteration."""
+        for group in self.groups.get(name, ()):
+            if not group.deleted:
+                yield group
+
+    def __iter__(self):
+        for name in list(self.groups):
+            yield from self.of_type(name)
+
+    def __len__(self):
+        return sum(len(groups) for groups in self.groups.values()) - self.removed
+
+    def compact(self):
+        if self.removed:
+            self.groups = {name: [group for group in groups if not group.deleted]
+                           for name, groups in self.groups.items()}
+            self.removed = 0
+
+
 class Group:
-    all_groups = []  # A list to store all the group instances
+    __slots__ = ("uid", "deleted", "individuals", "total_energy", "current_cell")
 
     def __init__(self, initiation_cell, *individuals: Animal | Erbast | Carviz):
+        self.uid = initiation_cell.world.new_uid()  # Serial id, see Entity.__hash__
         self.deleted = False  # Flag to mark if the group is deleted
-        self.individuals = set(individuals)  # Set to store the individuals in the group
-        self.all_groups.append(self)  # Add the group to the list of all groups
-        initiation_cell.groups[self.name()].add(self)  # Add the group to the cell's group set
+        self.individuals = dict.fromkeys(individuals)  # Ordered set of the individuals in the group, see Cell.groups
+        # Sum of the energies of the individuals, kept up to date by Animal._add_energy and the group changes
+        self.total_energy = sum(individual.energy for individual in self.individuals)
+        initiation_cell.world.groups.add(self)  # Add the group to the registry of the world
+        initiation_cell.groups[self.name()][self] = None  # Add the group to the cell's groups
         self.current_cell: Cell = initiation_cell  # Current cell where the group is located
+        if initiation_cell.world.profiler is not None:
+            initiation_cell.world.profiler.count("groups_created")
+
+    def __hash__(self):
+        return self.uid
 
     def remove_from_current_cell(self):
         if self in self.current_cell.groups[self.name()]:
-            self.current_cell.groups[self.name()].remove(
-                self)  # Remove the group from the cell's group set
+            del self.current_cell.groups[self.name()][self]  # Remove the group from the cell's groups
 
     def add_to_target_cell(self, cell: Cell):
-        cell.groups[self.name()].add(self)  # Add the group to the target cell's group set
+        cell.groups[self.name()][self] = None  # Add the group to the target cell's groups
         self.current_cell = cell  # Update the current cell of the group
 
     def set_current_cell(self):
@@ -43,9 +89,10 @@ class Group:
             return False
 
     def join(self, other_group):
-        self.individuals.union(other_group.individuals)  # Merge the individuals from the other group into this group
+        self.individuals | other_group.individuals  # Merge the individuals from the other group into this group
         other_group.delete()  # Delete the other group
 
+    @profiled("movement")
     def movement(self):
         if not self.decide_to_move():
             return False
@@ -64,6 +111,8 @@ class Group:
 
     def delete(self, kill_individuals=False):
         self.deleted = True
+        if self.current_cell.world.profiler is not None:
+            self.current_cell.world.profiler.count("groups_deleted")
 
         if kill_individuals:
             for individual in list(self.individuals):
@@ -72,7 +121,7 @@ class Group:
             for individual in list(self.individuals):
                 individual.remove_from_current_group()  # Remove the individual from the group
 
-        self.all_groups.remove(self)  # Remove the group from the list of all groups
+        self.current_cell.world.groups.remove(self)  # Remove the group from the registry of the world
         self.remove_from_current_cell()  # Remove the group from the current cell
 
     def delete_if_no_members(self):
@@ -96,19 +145,24 @@ class Group:
 
 
 class Herd(Group):
+    __slots__ = ()
+
     def __init__(self, initiation_cell, *individuals: Erbast):
         super().__init__(initiation_cell, *individuals)
 
+    @profiled("grazing")
     def grazing(self):
         for individual in self.individuals:
             individual.graze()  # Perform grazing action for each individual in the herd
 
+    @profiled("join_all")
     def join_all(self):
         for group in list(self.current_cell.groups[self.__class__.__name__.lower()]):
             if group is self:
                 continue
             self.join(group)  # Merge with other herds in the same cell
 
+    @profiled("live_day")
     def live_day(self):
         if self.delete_if_no_members() or self.deleted is True:
             return
@@ -119,6 +173,8 @@ class Herd(Group):
 
 
 class Pride(Group):
+    __slots__ = ()
+
     def __init__(self, initiation_cell, *individuals: Carviz):
         super().__init__(initiation_cell, *individuals)
 
@@ -127,29 +183,37 @@ class Pride(Group):
             return 0
         return sum(carviz.social_attitude for carviz in self.individuals) / len(self.individuals)
 
+    @profiled("try_join_all")
     def try_join_all(self):
         for pride in list(self.current_cell.groups[self.__class__.__name__.lower()]):
             if pride is self or pride.get_average_social_attitude() < 0.5 or self.get_average_social_attitude() < 0.5:
                 continue
             self.join(pride)  # Merge with other prides in the same cell
 
+    @profiled("initiate_fight")
     def initiate_fight(self):
         prides_pool = {}
         for pride in self.current_cell.groups[self.__class__.__name__.lower()]:
-            prides_pool[pride] = sum(carviz.energy for carviz in pride.individuals)
+            prides_pool[pride] = pride.total_energy
 
         prides = list(prides_pool.keys())
         weights = list(prides_pool.values())
-        winner = choices(prides, weights=weights, k=1)[0]  # Randomly select a pride based on their energy sum
+        winner = self.current_cell.world.random.choices(prides, weights=weights, k=1)[0]  # Randomly select a pride based on their energy sum
 
+        if self.current_cell.world.profiler is not None:
+            self.current_cell.world.profiler.count("fights")
         for pride in prides:
             if pride is not winner:
                 pride.delete(kill_individuals=True)  # Delete the losing prides and kill the individuals
 
     def find_strongest_erbast(self) -> Erbast:
-        strongest_erbast_instance = max(self.current_cell.population["erbast"], key=lambda instance: instance.energy)
-        return strongest_erbast_instance  # Find the strongest Erbast instance in the cell
+        """
+        Find the strongest Erbast instance in the cell, from the energy-ordered index of the cell.
+        ASSUMPTION: Among erbasts with the same energy, the oldest one is the strongest.
+        """
+        return self.current_cell.strongest_erbast()
 
+    @profiled("hunt")
     def hunt(self):
         victim = self.find_strongest_erbast()  # Find the strongest Erbast in the cell
 
@@ -157,10 +221,13 @@ class Pride(Group):
         energy_per_carviz = received_energy / len(self.individuals)
 
         for carviz in self.individuals:
-            carviz.energy += energy_per_carviz  # Distribute the energy among the Carviz individuals
+            carviz._add_energy(energy_per_carviz)  # Distribute the energy among the Carviz individuals
 
         victim.delete()  # Delete the hunted Erbast
+        if self.current_cell.world.profiler is not None:
+            self.current_cell.world.profiler.count("hunts")
 
+    @profiled("live_day")
     def live_day(self):
         if self.delete_if_no_members() or self.deleted:
             return
@@ -0,0 +1,125 @@
+"""
+Headless batch runner: simulate a World without any display and stream the daily population counts.
+
+Usage: python headless.py --days 1000 --seed 42 --rows 100 --cols 100 --csv population.csv
+       python headless.py --days 1000 --seed 42 --cache .simulation-cache
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from cache import ResultCache
+from config import SimulationConfig
+from tiled import tile_count
+from world import World
+from constants import NUMCELLS_R, NUMCELLS_C
+
+
+def simulate(days: int, seed: int | None = None, rows: int = NUMCELLS_R, cols: int = NUMCELLS_C,
+             engine: str = "object"):
+    """
+    Generate a World and live the given number of days.
+    :return: A generator of (day, population counts) pairs, starting with day 0 before the first live_day
+    """
+    world = World(rows, cols, engine=engine, seed=seed)
+    try:
+        world.generate()
+        yield 0, world.population_counts()
+
+        for day in range(1, days + 1):
+            world.live_day()
+            yield day, world.population_counts()
+    finally:
+        # Also when the caller stops early, the tiled engine holds worker processes and shared memory
+        world.close()
+
+
+def run_cached(cache: ResultCache, days: int, seed: int, rows: int | None = None, cols: int | None = None,
+               engine: str = "object", keep_checkpoint: bool = False, appeal_evaluation: str = "cell",
+               topology: str = "bounded", terrain: str = "random", tiles: int | None = None,
+               config: SimulationConfig | None = None):
+    """
+    Return the population series of a seeded run from the cache, simulating and storing it on a miss.
+    The options are those of World, and all of them are part of the cache key. The tiles of the tiled engine
+    are resolved first, since its run depends on the number of bands and the default is one per core.
+    :param keep_checkpoint: Also store a checkpoint of the last day of the run
+    :return: The species names and a (days + 1, species) array of counts
+    """
+    world = World(rows, cols, engine=engine, appeal_evaluation=appeal_evaluation, topology=topology,
+                  tiles=tiles, terrain=terrain, seed=seed, config=config)
+    run = {
+        "days": days,
+        "seed": seed,
+        "engine": engine,
+        "appeal_evaluation": appeal_evaluation,
+        "topology": topology,
+        "terrain": terrain,
+        "tiles": tile_count(world.rows, tiles) if engine == "tiled" else None,
+        "config": world.config.as_dict(),
+    }
+    cached = cache.get(run)
+    # A series cached without its checkpoint is simulated again, the seeded run ends on the same day
+    if cached is not None and (not keep_checkpoint or cache.checkpoint_path(run) is not None):
+        return cached
+
+    try:
+        world.generate()
+        series = [list(world.population_counts().values())]
+        for day in range(days):
+            if world.is_quiescent():
+                # Nothing changes any more, the remaining days are skipped with the same counts
+                series.extend([series[-1]] * (days - day))
+                world.live_days(days - day)
+                break
+            world.live_day()
+            series.append(list(world.population_counts().values()))
+        species_names = list(world.population_counts().keys())
+        counts = np.array(series, dtype=np.int64)
+        cache.put(run, species_names, counts, world if keep_checkpoint else None)
+    finally:
+        world.close()
+    return species_names, counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the simulation without a display.")
+    parser.add_argument("--days", type=int, default=100, help="number of days to simulate")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random generators of the world")
+    parser.add_argument("--rows", type=int, default=NUMCELLS_R, help="number of rows of the grid")
+    parser.add_argument("--cols", type=int, default=NUMCELLS_C, help="number of columns of the grid")
+    parser.add_argument("--engine", choices=World.available_engines, default="object")
+    parser.add_argument("--csv", default=None, help="write the counts to this CSV file instead of stdout")
+    parser.add_argument("--cache", default=None, help="directory of the result cache, requires --seed")
+    parser.add_argument("--cache-size", type=int, default=1024, help="size limit of the cache in megabytes")
+    parser.add_argument("--checkpoint", action="store_true", help="also cache a checkpoint of the last day")
+    args = parser.parse_args(argv)
+    if args.cache and args.seed is None:
+        parser.error("--cache requires --seed")
+
+    output = open(args.csv, "w", newline="") if args.csv else sys.stdout
+    try:
+        if args.cache:
+            cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+            species_names, counts = run_cached(cache, args.days, args.seed, args.rows, args.cols, args.engine,
+                                               args.checkpoint)
+            writer = csv.writer(output)
+            writer.writerow(["day", *species_names])
+            writer.writerows([day, *row] for day, row in enumerate(counts.tolist()))
+            return
+
+        writer = None
+        for day, population_counts in simulate(args.days, args.seed, args.rows, args.cols, args.engine):
+            if writer is None:
+                writer = csv.writer(output)
+                writer.writerow(["day", *population_counts.keys()])
+            writer.writerow([day, *population_counts.values()])
+            output.flush()  # stream each day as soon as it is computed
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Opt-in instrumentation of World.live_day: wall time per phase and per group type, and event counters,
+recorded for every day.
+
+Profiling is off unless World.enable_profiling() is called. While no world is profiled, the instrumented
+methods are the plain methods, without any timing wrapper.
+"""
+import time
+from collections import deque
+from functools import wraps
+
+
+class Profiler:
+    """
+    Per-day wall times and counters of a World.
+
+    Times are recorded by phase name, e.g. "first_phase" for the per-cell sweep or "pride.hunt" for the hunts
+    of the prides. Phases are nested: "groups" includes "herd.live_day", which includes "herd.movement".
+    Counters count events such as moves, births or deaths. The records of the last `capacity` days are kept.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.days = deque(maxlen=capacity)
+        self.times = {}
+        self.counters = {}
+
+    def add_time(self, phase: str, seconds: float):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+    def count(self, counter: str, amount: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def end_day(self, day: int):
+        # Stores the times and counters recorded since the previous day
+        self.days.append({"day": day, "times": self.times, "counters": self.counters})
+        self.times = {}
+        self.counters = {}
+
+    def clear(self):
+        self.days.clear()
+        self.times = {}
+        self.counters = {}
+
+    def records(self) -> list:
+        """Return the {"day", "times", "counters"} record of each profiled day, from the oldest."""
+        return list(self.days)
+
+    def totals(self) -> tuple:
+        """
+        Sum the times and the counters over the recorded days.
+        :return: The (times, counters) pair of dicts
+        """
+        times, counters = {}, {}
+        for record in self.days:
+            for phase, seconds in record["times"].items():
+                times[phase] = times.get(phase, 0.0) + seconds
+            for counter, amount in record["counters"].items():
+                counters[counter] = counters.get(counter, 0) + amount
+        return times, counters
+
+    def summary(self) -> str:
+        """Format the totals and the per-day means of the recorded days as a table."""
+        times, counters = self.totals()
+        days = max(len(self.days), 1)
+        day_time = times.get("day", 0.0) or 1.0
+        lines = [f"{len(self.days)} days profiled",
+                 f"{'phase':<28}{'total s':>10}{'ms/day':>10}{'of day':>8}"]
+        for phase, seconds in sorted(times.items(), key=lambda item: -item[1]):
+            lines.append(f"{phase:<28}{seconds:>10.3f}{seconds / days * 1000:>10.2f}{seconds / day_time:>8.1%}")
+        lines.append(f"{'counter':<28}{'total':>10}{'per day':>10}")
+        for counter, amount in sorted(counters.items()):
+            lines.append(f"{counter:<28}{amount:>10}{amount / days:>10.1f}")
+        return "\n".join(lines)
+
+
+# Methods decorated with profiled, as (class, attribute name, plain method, instrumented method) entries
+_PROFILED_METHODS = []
+# Number of worlds being profiled, the instrumented methods are installed while it is positive
+_profiled_worlds = 0
+
+
+class _ProfiledMethod:
+    # Placeholder left by profiled in the body of a class: once the class exists, it registers the method and
+    # replaces itself with the plain or the instrumented method
+    def __init__(self, method, wrapper):
+        self.method = method
+        self.wrapper = wrapper
+
+    def __set_name__(self, owner, name):
+        _PROFILED_METHODS.append((owner, name, self.method, self.wrapper))
+        setattr(owner, name, self.wrapper if _profiled_worlds else self.method)
+
+
+def profiled(phase: str):
+    """
+    Decorate a method of the World, of an animal or of a group to record its wall time when the world is
+    profiled. The phase of animal and group methods is prefixed with the name of their class.
+    The timing wrapper is only installed while a world is profiled, see start_instrumentation, so the
+    decorated methods cost nothing otherwise.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            # Entities and groups reach their world through their cell
+            world = self.current_cell.world if hasattr(self, "current_cell") else self
+            profiler = world.profiler
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                name = f"{self.name()}.{phase}" if hasattr(self, "name") else phase
+                profiler.add_time(name, time.perf_counter() - start)
+        return _ProfiledMethod(method, wrapper)
+    return decorator
+
+
+def start_instrumentation():
+    """Install the timing wrappers of the profiled methods, for a world that starts being profiled."""
+    global _profiled_worlds
+    _profiled_worlds += 1
+    if _profiled_worlds == 1:
+        for owner, name, _, wrapper in _PROFILED_METHODS:
+            setattr(owner, name, wrapper)
+
+
+def stop_instrumentation():
+    """Restore the plain profiled methods once no world is profiled any more."""
+    global _profiled_worlds
+    _profiled_worlds = max(_profiled_worlds - 1, 0)
+    if _profiled_worlds == 0:
+        for owner, name, method, _ in _PROFILED_METHODS:
+            setattr(owner, name, method)
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+
+from world import World
+
+
+class DaySnapshot:
+    """
+    Immutable copy of what the UI draws for one day, so that it can be rendered while the world lives on.
+    terrain is only set on the snapshots of a newly generated world until the consumer has taken one of them.
+    """
+    __slots__ = ("day", "population_counts", "species_count_maps", "telemetry_days", "telemetry", "terrain")
+
+    def __init__(self, world: World, with_terrain: bool = False):
+        self.day = world.day
+        self.population_counts = world.population_counts()
+        self.species_count_maps = world.species_count_maps()
+        self.telemetry_days = world.telemetry.days_view().copy()
+        self.telemetry = {species: world.telemetry.view(species).copy() for species in self.population_counts}
+        self.terrain = world.terrain_map() if with_terrain else None
+
+
+class SimulationThread(threading.Thread):
+    """
+    Live the days of a world in a background thread, at a target number of days per second (None for as fast
+    as possible), and publish a DaySnapshot after each day into a bounded queue.
+    When the consumer falls behind, the oldest snapshots are dropped instead of slowing the simulation down.
+    Pause, resume and reset only set flags, so they return immediately even while a long day is computing;
+    they take effect at the end of that day.
+    """
+
+    def __init__(self, world: World, days_per_second: float | None = 10.0, queue_size: int = 2):
+        super().__init__(daemon=True)
+        self.world = world
+        self.days_per_second = days_per_second
+        self.snapshots = queue.Queue(maxsize=queue_size)
+        self._running = threading.Event()
+        self._reset_requested = threading.Event()
+        self._stop_requested = threading.Event()
+        self._wake = threading.Event()  # Interrupts the waits when a control changes
+        # The terrain of a new world is sent with every snapshot until one of them is consumed, so that a
+        # snapshot that replaces it in the queue does not lose it
+        self._terrain_pending = False
+        self._lock = threading.Lock()  # Guards the queue hand-off and _terrain_pending
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+        self._wake.set()
+
+    def resume(self):
+        self._running.set()
+        self._wake.set()
+
+    def request_reset(self):
+        # Generates a new world and pauses the simulation
+        self._running.clear()
+        self._reset_requested.set()
+        self._wake.set()
+
+    def set_days_per_second(self, days_per_second: float | None):
+        self.days_per_second = days_per_second
+        self._wake.set()
+
+    def stop(self):
+        self._stop_requested.set()
+        self._wake.set()
+
+    def latest_snapshot(self) -> DaySnapshot | None:
+        """Return the newest published snapshot, dropping the older ones, or None if there is no new one."""
+        snapshot = None
+        with self._lock:
+            while True:
+                try:
+                    snapshot = self.snapshots.get_nowait()
+                except queue.Empty:
+                    break
+            if snapshot is not None and snapshot.terrain is not None:
+                self._terrain_pending = False
+        return snapshot
+
+    def _publish(self, with_terrain: bool = False):
+        # Only this thread sets _terrain_pending, so a snapshot copied without the terrain never misses it
+        snapshot = DaySnapshot(self.world, with_terrain or self._terrain_pending)
+        with self._lock:
+            if with_terrain:
+                self._terrain_pending = True
+            while True:
+                try:
+                    self.snapshots.put_nowait(snapshot)
+                    return
+                except queue.Full:
+                    try:
+                        self.snapshots.get_nowait()  # drop the oldest snapshot
+                    except queue.Empty:
+                        pass
+
+    def run(self):
+        self._publish(with_terrain=True)
+        next_day = time.perf_counter()
+        while not self._stop_requested.is_set():
+            self._wake.clear()
+            if self._reset_requested.is_set():
+                self._reset_requested.clear()
+                self.world.generate()
+                self.latest_snapshot()  # snapshots of the previous world are obsolete
+                self._publish(with_terrain=True)
+                continue
+            if not self._running.is_set():
+                self._wake.wait(timeout=0.1)
+                next_day = time.perf_counter()
+                continue
+
+            days_per_second = self.days_per_second
+            if days_per_second:
+                delay = next_day - time.perf_counter()
+                if delay > 0:
+                    self._wake.wait(timeout=delay)
+                    continue
+                # Do not try to catch up with days that could not be lived in time
+                next_day = max(next_day, time.perf_counter() - 1 / days_per_second) + 1 / days_per_second
+
+            self.world.live_day()
+            self._publish()
+
@@ -1,13 +1,18 @@
-import random
 from abc import abstractmethod, ABC
 
-from constants import MAX_ENERGY, MAX_LIFE, GROWING, AGING, MAX_GROUP
-
 from cells import Cell
 from groups import Pride, Herd
+from profiling import profiled
 
 
 class Entity(ABC):
+    # Entities are numerous, so they store their attributes in slots instead of a per-instance __dict__
+    __slots__ = ("uid",)
+
+    def __hash__(self):
+        # Hashing by serial id keeps the entities independent of memory addresses, e.g. in the erbast heaps
+        return self.uid
+
     @abstractmethod
     def live_first_phase_of_a_day(self):
         """
@@ -25,13 +30,46 @@ class Entity(ABC):
         return cls.__name__.lower()
 
 
+# Densities and growth rates that are multiples of 1 / GROWTH_SCALE grow exactly in floating point
+GROWTH_SCALE = 2 ** 20
+
+
+def grown_density(density: float, growing: float, days: int) -> float:
+    """
+    Get the density of a vegetob after `days` days of growth, i.e. after adding growing to it once a day
+    while it is below 100.
+    When the density and the rate are multiples of 1 / GROWTH_SCALE, every daily sum is exact, so the
+    closed form computed on integers gives the same float. Otherwise the daily additions are replayed, at
+    most until the vegetob is saturated.
+    """
+    if density >= 100 or days <= 0:
+        return density
+    # The density and the rate may be ints, e.g. the default density of Vegetebob
+    density, growing = float(density), float(growing)
+    scaled_density, scaled_growing = density * GROWTH_SCALE, growing * GROWTH_SCALE
+    if scaled_density.is_integer() and scaled_growing.is_integer() and abs(density) + abs(growing) < 2 ** 32:
+        scaled_density, scaled_growing = int(scaled_density), int(scaled_growing)
+        steps = days
+        if scaled_growing > 0:
+            steps = min(days, -(-(100 * GROWTH_SCALE - scaled_density) // scaled_growing))
+        return (scaled_density + steps * scaled_growing) / GROWTH_SCALE
+    for _ in range(days):
+        if density >= 100:
+            break
+        density += growing
+    return density
+
+
 class Vegetebob(Entity):
+    __slots__ = ("_density", "growth_day", "current_cell", "surrounding_vegetebobs")
+
     def __init__(self, spawn_cell: Cell, density: int = 5):
         """
         Initialize a Vegetebob entity with a given density in the specified spawn cell.
         """
-        self.density = density
+        self.uid = spawn_cell.world.new_uid()
         self.current_cell = spawn_cell
+        self.density = density
         self.surrounding_vegetebobs = None
 
         self.__add_to_cell(spawn_cell)
@@ -41,16 +79,17 @@ class Vegetebob(Entity):
         """
         Add the Vegetebob entity to the specified cell's population.
         """
-        cell.population[self.name()].add(self)
+        cell.population[self.name()][self] = None
         self.current_cell = cell
-        cell.trigger_appeal_evaluation()
+        cell.mark_appeal_dirty()
+        cell.update_activity()
 
     def __add_to_world_population_data(self):
         """
         Add the Vegetebob entity to the world's population data.
         """
         if self not in self.current_cell.world.population[self.name()]:
-            self.current_cell.world.population[self.name()].add(self)
+            self.current_cell.world.population[self.name()][self] = None
 
     def __str__(self):
         """
@@ -58,14 +97,25 @@ class Vegetebob(Entity):
         """
         return f"Vegetob: Density - {self.density}"
 
-    def __grow(self):
+    @property
+    def density(self) -> float:
         """
-        Increase the density of the Vegetebob entity.
-        The density can grow up to a maximum value of 100.
+        The density of the Vegetebob entity, which grows by the growing rate every day up to 100.
+        It is stored with the growth day of the world at which it was last set, and the growth of the days
+        since then is only computed when the density is read, see grown_density.
         """
-        if self.density < 100:
-            self.density += GROWING
-            self.current_cell.trigger_appeal_evaluation()
+        world = self.current_cell.world
+        if self.growth_day != world.growth_days:
+            self._density = grown_density(self._density, world.config.growing, world.growth_days - self.growth_day)
+            self.growth_day = world.growth_days
+        return self._density
+
+    @density.setter
+    def density(self, density: float):
+        self._density = density
+        self.growth_day = self.current_cell.world.growth_days
+        if density < 100:
+            self.current_cell.track_growth()
 
     def __get_surrounding_vegetebobs(self):
         """
@@ -74,7 +124,7 @@ class Vegetebob(Entity):
         surrounding_vegetebobs = []
         for cell in self.current_cell.get_surrounding_cells():
             if len(cell.population["vegetebob"]) != 0:
-                surrounding_vegetebobs.append(list(cell.population["vegetebob"])[0])
+                surrounding_vegetebobs.append(next(iter(cell.population["vegetebob"])))
 
         self.surrounding_vegetebobs = surrounding_vegetebobs
 
@@ -86,31 +136,35 @@ class Vegetebob(Entity):
         if self.surrounding_vegetebobs is None:
             self.__get_surrounding_vegetebobs()
         if all(vegetebob.density == 100 for vegetebob in self.surrounding_vegetebobs):
-            for animal in self.current_cell.population["erbast"].union(self.current_cell.population["carviz"]):
+            for animal in self.current_cell.population["erbast"] | self.current_cell.population["carviz"]:
                 del animal
 
     def live_first_phase_of_a_day(self):
         """
         Execute the first phase of a day in the life of the Vegetebob entity.
-        This phase involves growth and overwhelming of neighboring cells.
+        This phase involves overwhelming of neighboring cells, the growth is computed when the density is read.
         """
-        self.__grow()
         self.__overwhelm()
 
 
 class Animal(Entity):
+    __slots__ = ("deleted", "current_cell", "current_group", "energy", "lifetime", "social_attitude", "age")
+
     def __init__(self, spawn_cell: Cell):
         """
         Initialize an Animal entity with a random initial state in the specified spawn cell.
         """
+        self.uid = spawn_cell.world.new_uid()
         self.deleted = False
 
         self.current_cell: Cell | None = None
         self.current_group = None
 
-        self.energy = random.randint(1, MAX_ENERGY)
-        self.lifetime = random.randint(1, MAX_LIFE)
-        self.social_attitude = random.uniform(0, 1)
+        rng = spawn_cell.world.random
+        config = spawn_cell.world.config
+        self.energy = rng.randint(1, config.max_energy)
+        self.lifetime = rng.randint(1, config.max_life)
+        self.social_attitude = rng.uniform(0, 1)
         self.age = 0
 
         self.__add_to_cell(spawn_cell)
@@ -121,35 +175,70 @@ class Animal(Entity):
         Add the Animal entity to the world's population data.
         """
         if self not in self.current_cell.world.population[self.name()]:
-            self.current_cell.world.population[self.name()].add(self)
+            self.current_cell.world.population[self.name()][self] = None
 
     def __remove_from_world_population_data(self):
         """
         Remove the Animal entity from the world's population data.
         """
-        self.current_cell.world.population[self.name()].remove(self)
+        del self.current_cell.world.population[self.name()][self]
 
     def __remove_from_current_cell(self):
         """
         Remove the Animal entity from its current cell's population.
         """
-        self.current_cell.population[self.name()].remove(self)
-        self.current_cell.trigger_appeal_evaluation()
+        del self.current_cell.population[self.name()][self]
+        self.current_cell.mark_appeal_dirty()
+        self.current_cell.update_activity()
+        self._left_cell()
 
     def __add_to_cell(self, cell: Cell):
         """
         Add the Animal entity to the specified cell's population.
         """
-        cell.population[self.name()].add(self)
+        cell.population[self.name()][self] = None
         self.current_cell = cell
-        cell.trigger_appeal_evaluation()
+        cell.mark_appeal_dirty()
+        cell.update_activity()
+        self._entered_cell()
+
+    def _entered_cell(self):
+        """
+        Hook called when the Animal entity enters a cell.
+        Overridden by Erbast, like _left_cell and _energy_changed, to keep the energy-ordered index of its
+        cell in sync.
+        """
+        pass
+
+    def _left_cell(self):
+        """
+        Hook called when the Animal entity leaves its cell or dies.
+        """
+        pass
+
+    def _energy_changed(self):
+        """
+        Hook called when the energy of the Animal entity changes in its cell.
+        """
+        pass
+
+    def _add_energy(self, amount):
+        """
+        Change the energy of the Animal entity, keeping the energy total of its group in sync.
+        """
+        self.energy += amount
+        if self.current_group is not None:
+            self.current_group.total_energy += amount
 
     def remove_from_current_group(self):
         """
         Remove the Animal entity from its current group.
         """
         if self.current_group is not None:
-            self.current_group.individuals.remove(self)
+            del self.current_group.individuals[self]
+            self.current_group.total_energy -= self.energy
+            if not self.current_group.individuals:
+                self.current_group.total_energy = 0  # Drop the rounding errors of the running sum
             self.current_group = None
 
     def _add_to_group(self, target_group):
@@ -157,36 +246,29 @@ class Animal(Entity):
         Add the Animal entity to the specified group.
         """
         self.current_group = target_group
-        target_group.individuals.add(self)
+        if self not in target_group.individuals:
+            target_group.individuals[self] = None
+            target_group.total_energy += self.energy
 
     def get_best_cell_in_neighborhood(self):
         """
         Get the best cell in the neighborhood for the Animal entity.
         By default, the best cell is the current cell. The Animal iterates through neighboring cells
         and if there is a cell with greater appeal, the best_cell variable is reassigned.
+        The scan is shared with the other animals of the species in the cell, see Cell.best_neighbor.
         :return: The Cell object with the greatest appeal for the given species
         """
-        best_cell: Cell = self.current_cell
-
-        for cell in self.current_cell.get_surrounding_cells():
-            # Animals prefer to stay in the current cell due to energy, therefore if
-            if best_cell is self.current_cell:
-                best_cell_appeal = best_cell.appeal[self.name()] + 50
-            else:
-                best_cell_appeal = best_cell.appeal[self.name()]
-
-            if cell.appeal[self.name()] >= best_cell_appeal and cell.cell_type != "water":
-                best_cell = cell
-
-        return best_cell
+        return self.current_cell.best_neighbor(self.name())
 
     def move(self, target_cell: Cell):
         """
         Move the Animal entity to the target cell, consuming energy in the process.
         """
-        self.energy -= 1
+        self._add_energy(-1)
         self.__remove_from_current_cell()
         self.__add_to_cell(target_cell)
+        if target_cell.world.profiler is not None:
+            target_cell.world.profiler.count("moves")
 
     def __increase_age(self):
         """
@@ -194,7 +276,8 @@ class Animal(Entity):
         """
         self.age += 1
         if self.age % 10 == 0:
-            self.energy -= AGING
+            self._add_energy(-self.current_cell.world.config.aging)
+            self._energy_changed()
 
     def decide_to_move(self):
         """
@@ -215,8 +298,10 @@ class Animal(Entity):
         If the current group has fewer members than the maximum allowed group size,
         the Animal can spawn offspring.
         """
-        if len(self.current_group.individuals) < MAX_GROUP:
+        if len(self.current_group.individuals) < self.current_cell.world.config.max_group:
             self.__class__(self.current_cell)
+            if self.current_cell.world.profiler is not None:
+                self.current_cell.world.profiler.count("births")
 
     def __die_from_lifetime(self):
         """
@@ -260,18 +345,23 @@ class Animal(Entity):
         Delete the Animal entity from the simulation.
         """
         self.deleted = True
+        if self.current_cell.world.profiler is not None:
+            self.current_cell.world.profiler.count("deaths")
         self.__remove_from_current_cell()
         self.__remove_from_world_population_data()
         self.remove_from_current_group()
 
 
 class Erbast(Animal):
+    __slots__ = ()
+
     def __init__(self, spawn_cell: Cell):
         """
         Initialize an Erbast entity in the specified spawn cell.
         """
         super().__init__(spawn_cell)
 
+    @profiled("initiate_group")
     def initiate_group(self):
         """
         Initiate a group for the Erbast entity.
@@ -284,24 +374,43 @@ class Erbast(Animal):
         for animal in animals_without_group_in_current_cell + [self]:
             animal._add_to_group(herd)
 
+    def _entered_cell(self):
+        """
+        Index the current energy of the Erbast entity in its new cell, see Cell.index_erbast.
+        """
+        self.current_cell.index_erbast(self)
+
+    def _left_cell(self):
+        self.current_cell.unindex_erbast(self)
+
+    def _energy_changed(self):
+        self.current_cell.index_erbast(self, replaced=True)
+
     def graze(self):
         """
         Increase the energy of the Erbast entity by 1 if there is Vegetob in the cell.
         """
         if len(self.current_cell.population["vegetebob"]) != 0:
-            vegetebob_elem: Vegetebob = list(self.current_cell.population["vegetebob"])[0]
+            vegetebob_elem: Vegetebob = next(iter(self.current_cell.population["vegetebob"]))
             if vegetebob_elem.density > 0:
+                # Grazing does not change the appeal, so a pending evaluation must see the density before it
+                if self.current_cell.appeal_outdated():
+                    self.current_cell.trigger_appeal_evaluation()
                 vegetebob_elem.density -= 1
-                self.energy += 1
+                self._add_energy(1)
+                self._energy_changed()
 
 
 class Carviz(Animal):
+    __slots__ = ()
+
     def __init__(self, spawn_cell: Cell):
         """
         Initialize a Carviz entity in the specified spawn cell.
         """
         super().__init__(spawn_cell)
 
+    @profiled("initiate_group")
     def initiate_group(self):
         """
         Initiate a group for the Carviz entity.
@@ -0,0 +1,285 @@
+"""
+Streaming server: live a World in the background and push every day to browsers over WebSocket, with only
+the standard library's asyncio. Open http://127.0.0.1:8765/ to watch the run with the viewer of viewer.html.
+
+Each day is sent as a binary frame holding the cells that changed since the frame the client last received,
+and a full keyframe every `keyframe_every` days. A client that reads slower than the world lives only gets
+the newest day when it is ready again, so it never slows the simulation down.
+
+Usage: python streaming.py --rows 100 --cols 100 --seed 42 --days-per-second 20 --keyframe-every 100
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+import time
+
+import numpy as np
+
+from world import World
+from constants import NUMCELLS_R, NUMCELLS_C, GROUND_COLOR
+
+VIEWER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewer.html")
+
+# Kinds of frames
+KEYFRAME = 0
+DELTA = 1
+
+# Frame header, little-endian: kind, 3 pad bytes, day, rows, cols, number of cells in the frame and the
+# vegetob, erbast and carviz populations. Its size keeps the arrays that follow aligned for typed arrays.
+FRAME_HEADER = struct.Struct("<B3xIHHIIII")
+
+# Per-cell arrays of a frame, in the order they follow the header, each one value per cell of the frame.
+# A delta starts with the uint32 flat indices of its cells, a keyframe holds every cell in scan order.
+CELL_ARRAYS = (("density", "<f4"), ("erbast", "<u2"), ("carviz", "<u2"), ("ground", "u1"), ("vegetebob", "u1"))
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class WorldFrame:
+    """
+    Copy of the drawn state of a world on one day: the population counts and flat per-cell arrays of
+    terrain, species counts and vegetob density. Encoded frames are cached per base, so that the clients
+    that are up to date share one encoding.
+    """
+    __slots__ = ("day", "rows", "cols", "population_counts", "cells", "encoded")
+
+    def __init__(self, world: World):
+        self.day = world.day
+        self.rows = world.rows
+        self.cols = world.cols
+        self.population_counts = world.population_counts()
+        species_count_maps = world.species_count_maps()
+        self.cells = {
+            "density": world.density_map().ravel().astype(np.float32),
+            "erbast": np.minimum(species_count_maps["erbast"].ravel(), 0xFFFF).astype(np.uint16),
+            "carviz": np.minimum(species_count_maps["carviz"].ravel(), 0xFFFF).astype(np.uint16),
+            "ground": (world.terrain_map().ravel() == GROUND_COLOR).astype(np.uint8),
+            "vegetebob": (species_count_maps["vegetebob"].ravel() > 0).astype(np.uint8),
+        }
+        self.encoded = {}
+
+    def encode(self, base: "WorldFrame | None" = None) -> bytes:
+        """
+        Encode the frame as a keyframe, or as the delta of the cells that changed since base.
+        :return: The header followed by the per-cell arrays, see FRAME_HEADER and CELL_ARRAYS
+        """
+        key = None if base is None else base.day
+        if key in self.encoded:
+            return self.encoded[key]
+        if base is None:
+            kind, parts = KEYFRAME, []
+            cells = self.cells
+        else:
+            changed = np.zeros(self.rows * self.cols, dtype=bool)
+            for name, values in self.cells.items():
+                changed |= values != base.cells[name]
+            indices = np.flatnonzero(changed).astype("<u4")
+            kind, parts = DELTA, [indices.tobytes()]
+            cells = {name: values[indices] for name, values in self.cells.items()}
+        parts += [cells[name].astype(dtype).tobytes() for name, dtype in CELL_ARRAYS]
+        header = FRAME_HEADER.pack(kind, self.day, self.rows, self.cols, len(cells["ground"]),
+                                   *(self.population_counts[name] for name in ("vegetebob", "erbast", "carviz")))
+        self.encoded[key] = data = header + b"".join(parts)
+        return data
+
+
+def websocket_frame(payload: bytes, opcode: int = 0x2) -> bytes:
+    # Returns an unmasked, unfragmented server frame, binary by default
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class Client:
+    """
+    A connected viewer. It holds at most one pending frame: a newer frame replaces a pending one that was not
+    sent yet, and deltas are always encoded against the last frame the client received.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, keyframe_every: int):
+        self.writer = writer
+        self.keyframe_every = keyframe_every
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.sent = None  # Last frame written to the client
+        self.keyframe_day = None  # Day of the last keyframe written to the client
+        self.dropped = 0
+
+    def offer(self, frame: WorldFrame):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.ready.set()
+
+    async def send_frames(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            frame, self.pending = self.pending, None
+            if self.keyframe_day is None or frame.day - self.keyframe_day >= self.keyframe_every:
+                data = frame.encode()
+                self.keyframe_day = frame.day
+            else:
+                data = frame.encode(self.sent)
+            self.writer.write(websocket_frame(data))
+            await self.writer.drain()
+            self.sent = frame
+
+
+class StreamingServer:
+    """
+    Serve the viewer over HTTP and the frames of a world over WebSocket at /frames, on one asyncio loop.
+    The days are lived in a worker thread, so the loop keeps serving the clients while a day computes.
+    """
+
+    def __init__(self, world: World, host: str = "127.0.0.1", port: int = 8765, keyframe_every: int = 100,
+                 days_per_second: float | None = 10.0):
+        if keyframe_every < 1:
+            raise ValueError("Keyframes must be sent at least every day")
+        self.world = world
+        self.host = host
+        self.port = port
+        self.keyframe_every = keyframe_every
+        self.days_per_second = days_per_second
+        self.clients = set()
+        self.connections = set()  # Tasks handling the open connections
+        self.frame = None  # Newest frame, sent first to the clients that connect
+
+    async def serve(self, days: int | None = None):
+        """Live the given number of days, forever if None, while serving the clients."""
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        async with server:
+            try:
+                await self.simulate(days)
+            finally:
+                # Close the streams, so that every connection ends before the loop does
+                for client in list(self.clients):
+                    client.writer.close()
+                await asyncio.gather(*self.connections, return_exceptions=True)
+
+    async def simulate(self, days: int | None = None):
+        loop = asyncio.get_running_loop()
+        self.frame = WorldFrame(self.world)
+        lived = 0
+        while days is None or lived < days:
+            start = time.perf_counter()
+            self.frame = await loop.run_in_executor(None, self._live_day)
+            for client in self.clients:
+                client.offer(self.frame)
+            lived += 1
+            if self.days_per_second:
+                await asyncio.sleep(max(0.0, 1 / self.days_per_second - (time.perf_counter() - start)))
+            else:
+                await asyncio.sleep(0)  # Let the clients send between days
+
+    def _live_day(self) -> WorldFrame:
+        self.world.live_day()
+        return WorldFrame(self.world)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections.add(asyncio.current_task())
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = request.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {name.strip().lower(): value.strip()
+                       for name, _, value in (line.partition(":") for line in header_lines if line)}
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", "text/plain", b"Only GET is supported")
+            elif path == "/frames" and headers.get("upgrade", "").lower() == "websocket":
+                if "sec-websocket-key" in headers:
+                    await self._stream(reader, writer, headers)
+                else:
+                    await self._respond(writer, "400 Bad Request", "text/plain", b"Missing Sec-WebSocket-Key")
+            elif path in ("/", "/viewer.html"):
+                with open(VIEWER_PATH, "rb") as file:
+                    await self._respond(writer, "200 OK", "text/html; charset=utf-8", file.read())
+            else:
+                await self._respond(writer, "404 Not Found", "text/plain", b"Not found")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+            self.connections.discard(asyncio.current_task())
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, content_type: str, body: bytes):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict):
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        await writer.drain()
+
+        client = Client(writer, self.keyframe_every)
+        if self.frame is not None:
+            client.offer(self.frame)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(client.send_frames())
+        receiver = asyncio.ensure_future(self._read_until_close(reader))
+        try:
+            done, _ = await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.clients.discard(client)
+            for task in (sender, receiver):
+                task.cancel()
+        # A sender or receiver that stopped on a dropped connection leaves nothing to answer
+        if any(task.exception() is not None for task in done):
+            return
+        writer.write(websocket_frame(b"", opcode=0x8))  # Answer the close frame of the client
+        await writer.drain()
+
+    @staticmethod
+    async def _read_until_close(reader: asyncio.StreamReader):
+        # Reads and discards the frames of the client until it closes the connection
+        while True:
+            first, second = await reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack("!H", await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack("!Q", await reader.readexactly(8))
+            await reader.readexactly(length + (4 if second & 0x80 else 0))
+            if first & 0x0F == 0x8:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a run of the simulation to browsers.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--days", type=int, default=None, help="number of days to simulate, forever by default")
+    parser.add_argument("--days-per-second", type=float, default=10.0,
+                        help="target speed of the simulation, 0 for as fast as possible")
+    parser.add_argument("--keyframe-every", type=int, default=100, help="send a full frame every this many days")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random generators of the world")
+    parser.add_argument("--rows", type=int, default=NUMCELLS_R, help="number of rows of the grid")
+    parser.add_argument("--cols", type=int, default=NUMCELLS_C, help="number of columns of the grid")
+    parser.add_argument("--engine", choices=World.available_engines, default="object")
+    args = parser.parse_args(argv)
+
+    world = World(args.rows, args.cols, engine=args.engine, seed=args.seed)
+    world.generate()
+    server = StreamingServer(world, args.host, args.port, args.keyframe_every, args.days_per_second or None)
+    print(f"Watch the run at http://{args.host}:{args.port}/")
+    try:
+        asyncio.run(server.serve(args.days))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        world.close()
+
+
+if __name__ == "__main__":
+    main()
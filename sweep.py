@@ -0,0 +1,197 @@
+"""
+Parameter sweeps: run a World for every combination of a grid of SimulationConfig parameters and seeds,
+in parallel on the local cores, and record one row per run in a SQLite table.
+
+A run stops before its day limit once the animals are extinct, after which only the vegetobs regrow, or
+once the population counts have not changed for a whole window of days. The latter is a heuristic: the
+vegetobs keep regrowing and the animals keep moving under stationary counts, so such a run could still
+change later. The summary reports the days and the estimated compute time that these early stops saved.
+
+Usage: python sweep.py --grid growing=0.5,1,2 --grid aging=1,2 --seeds 3 --days 2000 --database sweep.sqlite
+       python sweep.py --database sweep.sqlite --query "SELECT growing, AVG(days_run) FROM runs GROUP BY growing"
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields
+
+from config import SimulationConfig
+from world import World
+
+# Reasons for which a run ends, recorded in the stop_reason column
+STOP_REASONS = ("extinction", "equilibrium", "day_limit")
+
+ANIMAL_SPECIES = ("erbast", "carviz")
+SPECIES = ("vegetebob", "erbast", "carviz")
+
+
+def parameter_grid(grid: dict) -> list:
+    """
+    Expand a grid of parameter values, e.g. {"growing": [0.5, 1], "aging": [1, 2]}, into the list of all
+    its combinations, as dicts of parameter values.
+    """
+    names = [field.name for field in fields(SimulationConfig)]
+    unknown = [name for name in grid if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown}, expected some of {names}")
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def stop_reason(history: list, window: int) -> str | None:
+    """
+    Decide whether a run can stop, from the population counts of its days so far.
+    :param window: Number of days the counts must stay unchanged to be taken for an equilibrium, 0 to never
+        stop on it. Stationary counts do not prove that the state stopped changing, see the module docstring
+    :return: "extinction", "equilibrium" or None if the run must go on
+    """
+    if not any(history[-1][species] for species in ANIMAL_SPECIES):
+        return "extinction"
+    if 0 < window < len(history) and all(counts == history[-1] for counts in history[-window - 1:-1]):
+        return "equilibrium"
+    return None
+
+
+def run_point(parameters: dict, seed: int, days: int, window: int = 100, engine: str = "vectorized",
+              base: SimulationConfig | None = None) -> dict:
+    """
+    Run one point of a sweep until its day limit or an early stop.
+    :return: The row of the run, see SweepResults
+    """
+    config = (base if base is not None else SimulationConfig()).replace(**parameters)
+    start = time.perf_counter()
+    world = World(engine=engine, seed=seed, config=config)
+    world.generate()
+    history = [world.population_counts()]
+    reason = "day_limit"
+    try:
+        for _ in range(days):
+            world.live_day()
+            history.append(world.population_counts())
+            # Only the last window + 1 days are needed to detect an equilibrium
+            del history[:-window - 1]
+            reason = stop_reason(history, window) or reason
+            if reason != "day_limit":
+                break
+    finally:
+        world.close()
+    return {
+        **config.as_dict(),
+        "seed": seed,
+        "engine": engine,
+        "days": days,
+        "days_run": world.day,
+        "stop_reason": reason,
+        **{species: int(history[-1][species]) for species in SPECIES},
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class SweepResults:
+    """
+    SQLite table of the runs of sweeps, one row per run: the parameters of its configuration, its seed,
+    engine and day limit, the day it stopped at and why, its final population and its wall time.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.connection = sqlite3.connect(path)
+        parameter_columns = [f"{field.name} {'INTEGER' if field.type is int else 'REAL'}"
+                             for field in fields(SimulationConfig)]
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, {', '.join(parameter_columns)}, "
+            f"seed INTEGER, engine TEXT, days INTEGER, days_run INTEGER, stop_reason TEXT, "
+            f"{', '.join(f'{species} INTEGER' for species in SPECIES)}, seconds REAL)")
+        self.connection.commit()
+
+    def add(self, row: dict):
+        columns = list(row)
+        self.connection.execute(f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                [row[column] for column in columns])
+        self.connection.commit()
+
+    def query(self, sql: str, parameters: tuple = ()) -> list:
+        """:return: The rows of an SQL query on the runs table, as dicts"""
+        cursor = self.connection.execute(sql, parameters)
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def summary(self) -> str:
+        """
+        Describe the runs by stop reason and the compute saved by the early stops.
+        The time a stopped run saved is estimated from its own time per day.
+        """
+        totals = self.query("SELECT COUNT(*) AS runs, SUM(days) AS days, SUM(days_run) AS days_run, "
+                            "SUM(seconds) AS seconds, "
+                            "SUM(CASE WHEN days_run > 0 THEN seconds * (days - days_run) / days_run ELSE 0 END) "
+                            "AS saved_seconds FROM runs")[0]
+        if not totals["runs"]:
+            return "No runs"
+        lines = [f"{totals['runs']} runs in {totals['seconds']:.1f} s"]
+        for row in self.query("SELECT stop_reason, COUNT(*) AS runs, AVG(days_run) AS days_run FROM runs "
+                              "GROUP BY stop_reason ORDER BY stop_reason"):
+            lines.append(f"  {row['stop_reason']:<12}{row['runs']:>6} runs, {row['days_run']:>9.1f} days on average")
+        saved_days = totals["days"] - totals["days_run"]
+        lines.append(f"Saved {saved_days} of {totals['days']} days ({saved_days / totals['days']:.1%}), "
+                     f"about {totals['saved_seconds']:.1f} s of compute")
+        return "\n".join(lines)
+
+    def close(self):
+        self.connection.close()
+
+
+def sweep(grid: dict, seeds: list, days: int, results: SweepResults, window: int = 100,
+          engine: str = "vectorized", base: SimulationConfig | None = None, workers: int | None = None) -> int:
+    """
+    Run every combination of the grid with every seed on `workers` processes, one per core by default,
+    and add each run to results as soon as it finishes.
+    :return: The number of runs
+    """
+    points = list(itertools.product(parameter_grid(grid), seeds))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(run_point, parameters, seed, days, window, engine, base)
+                   for parameters, seed in points]
+        for future in as_completed(futures):
+            results.add(future.result())
+    return len(points)
+
+
+def parse_grid_argument(argument: str) -> tuple:
+    """Parse a --grid argument such as growing=0.5,1,2 into the name and the typed values of a parameter."""
+    name, _, values = argument.partition("=")
+    types = {field.name: field.type for field in fields(SimulationConfig)}
+    if name not in types or not values:
+        raise argparse.ArgumentTypeError(f"Expected a parameter of {list(types)} and its values, e.g. growing=0.5,1")
+    return name, [types[name](value) for value in values.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep a grid of simulation parameters.")
+    parser.add_argument("--grid", type=parse_grid_argument, action="append", default=[],
+                        help="parameter and comma-separated values, e.g. growing=0.5,1,2, may be repeated")
+    parser.add_argument("--seeds", type=int, default=1, help="number of seeds per combination, from 0")
+    parser.add_argument("--days", type=int, default=1000, help="day limit of every run")
+    parser.add_argument("--window", type=int, default=100,
+                        help="days of unchanged counts after which a run stops, 0 to disable")
+    parser.add_argument("--engine", choices=World.available_engines, default="vectorized")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, one per core by default")
+    parser.add_argument("--database", default=":memory:", help="SQLite file of the results table")
+    parser.add_argument("--query", default=None, help="print the result of an SQL query on the runs table")
+    args = parser.parse_args(argv)
+
+    results = SweepResults(args.database)
+    try:
+        if args.grid or args.query is None:
+            sweep(dict(args.grid), list(range(args.seeds)), args.days, results, args.window, args.engine,
+                  workers=args.workers)
+            print(results.summary())
+        if args.query is not None:
+            for row in results.query(args.query):
+                print(row)
+    finally:
+        results.close()
+
+
+if __name__ == "__main__":
+    main()
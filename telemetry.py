@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of the last values appended to it.
+
+    Every value is written twice, at its slot and at its slot + capacity, so that the values currently held
+    are always one contiguous slice of the backing array and can be read as a view without copying.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError("The capacity of a RingBuffer must be at least 1")
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        """
+        Append a value, evicting the oldest one when the buffer is full.
+        :return: The evicted value, None if the buffer was not full
+        """
+        evicted = None
+        if self._size == self.capacity:
+            evicted = self._data[self._start].item()
+            position = self._start
+            self._start = (self._start + 1) % self.capacity
+        else:
+            position = (self._start + self._size) % self.capacity
+            self._size += 1
+        self._data[position] = self._data[position + self.capacity] = value
+        return evicted
+
+    def view(self) -> np.ndarray:
+        """Return a read-only view of the values, from the oldest to the newest."""
+        view = self._data[self._start:self._start + self._size]
+        view.flags.writeable = False
+        return view
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+
+class Telemetry:
+    """
+    Bounded store of per-day metrics, such as the population counts of each species.
+
+    The last `capacity` days are kept at full resolution. Older days are not lost but downsampled: every
+    `bucket` evicted days are summarized by their min, max and mean in a history of `history_capacity`
+    buckets. Readers get zero-copy views, so the memory and the per-frame cost stay bounded on long runs.
+    """
+
+    statistics = ("min", "max", "mean")
+
+    def __init__(self, capacity: int = 1000, bucket: int = 10, history_capacity: int = 1000):
+        self.capacity = capacity
+        self.bucket = bucket
+        self.history_capacity = history_capacity
+        self.days = RingBuffer(capacity, dtype=np.int64)
+        self.metrics = {}  # Ring buffer of each metric
+        self.history_days = RingBuffer(history_capacity, dtype=np.int64)  # First day of each bucket
+        self.history = {}  # Ring buffers of the min, max and mean of each metric per bucket
+        self._pending_days = []
+        self._pending = {}  # Evicted values that do not fill a bucket yet
+
+    def clear(self):
+        self.days.clear()
+        self.history_days.clear()
+        self.metrics = {}
+        self.history = {}
+        self._pending_days = []
+        self._pending = {}
+
+    def record(self, day: int, metrics: dict):
+        """Record the metrics of a day. Every day must report the same metrics."""
+        evicted_day = self.days.append(day)
+        for name, value in metrics.items():
+            if name not in self.metrics:
+                self.metrics[name] = RingBuffer(self.capacity)
+            evicted = self.metrics[name].append(value)
+            if evicted is not None:
+                self._pending.setdefault(name, []).append(evicted)
+
+        if evicted_day is not None:
+            self._pending_days.append(evicted_day)
+            if len(self._pending_days) == self.bucket:
+                self._flush_bucket()
+
+    def record_repeated(self, first_day: int, days: int, metrics: dict):
+        """
+        Record the same metrics for the days first_day, first_day + 1, ..., first_day + days - 1, with the
+        same result as recording them one by one. Past the first capacity + bucket days, the buckets of the
+        history are filled in closed form, so the cost is bounded by the capacities instead of days.
+        """
+        day, last = first_day, first_day + days
+        # Day by day, until the recent days only hold these metrics and no evicted day is pending
+        while day < last and (day - first_day < self.capacity or self._pending_days):
+            self.record(day, metrics)
+            day += 1
+        if day == last:
+            return
+
+        # Every further day evicts a day with the same metrics, from the day `capacity` days before it
+        first_evicted = day - self.capacity
+        buckets, rest = divmod(last - day, self.bucket)
+        statistics = {name: (value, value, sum([value] * self.bucket) / self.bucket)
+                      for name, value in metrics.items()}
+        # The older buckets would be evicted from the history anyway
+        for index in range(max(buckets - self.history_capacity, 0), buckets):
+            self._append_bucket(first_evicted + index * self.bucket, statistics)
+        self._pending_days = list(range(first_evicted + buckets * self.bucket, last - self.capacity))
+        self._pending = {name: [value] * rest for name, value in metrics.items()} if rest else {}
+        self.days.clear()
+        for recent_day in range(last - self.capacity, last):
+            self.days.append(recent_day)
+
+    def _flush_bucket(self):
+        self._append_bucket(self._pending_days[0], {name: (min(values), max(values), sum(values) / len(values))
+                                                    for name, values in self._pending.items()})
+        self._pending_days = []
+        self._pending = {}
+
+    def _append_bucket(self, first_day: int, statistics: dict):
+        # Appends a bucket of the history from the (min, max, mean) of each metric
+        self.history_days.append(first_day)
+        for name, values in statistics.items():
+            if name not in self.history:
+                self.history[name] = {statistic: RingBuffer(self.history_capacity)
+                                      for statistic in self.statistics}
+            for statistic, value in zip(self.statistics, values):
+                self.history[name][statistic].append(value)
+
+    def view(self, name: str) -> np.ndarray:
+        """Return a zero-copy view of the recent values of a metric, aligned with days_view()."""
+        return self.metrics[name].view()
+
+    def days_view(self) -> np.ndarray:
+        return self.days.view()
+
+    def history_view(self, name: str, statistic: str) -> np.ndarray:
+        """Return a zero-copy view of one statistic of the downsampled history of a metric."""
+        return self.history[name][statistic].view()
+
+    def history_days_view(self) -> np.ndarray:
+        return self.history_days.view()
@@ -0,0 +1,302 @@
+import os
+from threading import BrokenBarrierError
+from multiprocessing import Barrier, Pipe, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from constants import WATER_COLOR, GROUND_COLOR
+from config import SimulationConfig
+from vectorized import VectorizedEngine
+from generation import make_rng
+
+# Seconds a worker is given to stop before it is terminated
+STOP_TIMEOUT = 5.0
+
+
+class NeighborBandError(RuntimeError):
+    """Raised by a band that was released from an exchange or a hand-off because a neighboring band failed."""
+
+
+def tile_count(rows: int, tiles: int | None = None) -> int:
+    """:return: The number of bands of a grid with the given rows, one per core by default and at most one per row"""
+    return max(1, min(tiles or os.cpu_count() or 1, rows))
+
+
+class TileWorker:
+    """
+    Simulate one band of rows of the world in its own process.
+
+    The band is held by a VectorizedEngine with one extra halo row above and below it. Before the herds and
+    the prides decide where to move, the appeal of the edge rows is exchanged with the neighboring bands
+    through shared memory, so that the halo rows hold the appeal seen by the single-process engine.
+    Groups that moved into a halo row are then handed off to the band that owns it.
+    """
+
+    def __init__(self, index: int, tiles: int, start: int, stop: int, cols: int, edges_name: str, barrier,
+                 inboxes: list, seed: int, config: SimulationConfig):
+        self.index = index
+        self.tiles = tiles
+        self.start = start  # first global row of the band
+        self.band = stop - start
+        self.cols = cols
+        self.engine = VectorizedEngine(self.band + 2, cols, rng=np.random.default_rng(seed), config=config)
+        self.edges_memory = SharedMemory(name=edges_name)
+        self.edges = np.ndarray((tiles, 2, cols), dtype=np.float64, buffer=self.edges_memory.buf)
+        self.barrier = barrier
+        self.inboxes = inboxes  # inboxes[t][0] receives from band t - 1, inboxes[t][1] from band t + 1
+
+    def load(self, ground: np.ndarray, has_vegetebob: np.ndarray, density: np.ndarray, animals: dict):
+        """Load the band from global arrays of its rows plus halo rows, and its animals in global cells."""
+        self.engine.ground = ground
+        self.engine.has_vegetebob = has_vegetebob
+        self.engine.density = density
+        self.engine._clear_animals()
+        self.engine._append(self._to_local(animals))
+
+    def _to_local(self, animals: dict) -> dict:
+        animals = dict(animals)
+        animals["cell"] = animals["cell"] - (self.start - 1) * self.cols
+        # Keep the members of each group together under fresh local group ids
+        grouped = animals["group"] >= 0
+        unique_groups, inverse = np.unique(animals["group"][grouped], return_inverse=True)
+        group = np.full(len(animals["group"]), -1, dtype=np.int64)
+        group[grouped] = self.engine._next_group + inverse.ravel()
+        self.engine._next_group += len(unique_groups)
+        animals["group"] = group
+        return animals
+
+    def _to_global(self, animals: dict) -> dict:
+        animals["cell"] = animals["cell"] + (self.start - 1) * self.cols
+        return animals
+
+    def exchange_appeal(self, appeal: np.ndarray) -> np.ndarray:
+        """Fill the halo rows of the appeal with the edge rows of the neighboring bands."""
+        cols = self.cols
+        self.edges[self.index, 0] = appeal[cols:2 * cols]
+        self.edges[self.index, 1] = appeal[self.band * cols:(self.band + 1) * cols]
+        self.barrier.wait()
+        if self.index > 0:
+            appeal[:cols] = self.edges[self.index - 1, 1]
+        if self.index < self.tiles - 1:
+            appeal[(self.band + 1) * cols:] = self.edges[self.index + 1, 0]
+        self.barrier.wait()  # nobody writes the next edges before everyone has read these ones
+        return appeal
+
+    def hand_off(self, moved: np.ndarray) -> np.ndarray:
+        """
+        Send the animals standing in a halo row to the band that owns the row and receive theirs.
+        :return: The moved mask of the animals after the hand-off
+        """
+        row = self.engine.cell // self.cols
+        outgoing = [(row == 0, self.index - 1, 1), (row == self.band + 1, self.index + 1, 0)]
+        for mask, neighbor, side in outgoing:
+            if 0 <= neighbor < self.tiles:
+                animals = self._to_global(self.engine._take(mask))
+                animals["moved"] = moved[mask]
+                self.inboxes[neighbor][side].put(animals)
+
+        staying = (row > 0) & (row <= self.band)
+        moved = moved[staying]
+        self.engine._keep(staying)
+        for neighbor, side in ((self.index - 1, 0), (self.index + 1, 1)):
+            if 0 <= neighbor < self.tiles:
+                animals = self.inboxes[self.index][side].get()
+                if animals is None:
+                    raise NeighborBandError(f"Band {neighbor} failed during the hand-off")
+                moved = np.concatenate([moved, animals.pop("moved")])
+                self.engine._append(self._to_local(animals))
+        return moved
+
+    def live_day(self):
+        """Live one day of the band, in the phase order of VectorizedEngine.live_day."""
+        engine = self.engine
+        engine._grow()
+        engine._live_first_phase()
+
+        erbast = engine._join_herds()
+        moved = engine._move_groups(erbast, self.exchange_appeal(engine.appeal()[0]))
+        engine._graze(self.hand_off(moved))
+
+        carviz = engine._join_prides()
+        moved = engine._move_groups(carviz, self.exchange_appeal(engine.appeal()[1]))
+        engine._fight_and_hunt(self.hand_off(moved))
+
+    def real_rows(self, array: np.ndarray) -> np.ndarray:
+        # Returns the part of a per-cell array that belongs to the band, without the halo rows
+        return array[self.cols:(self.band + 1) * self.cols]
+
+    def serve(self, pipe):
+        """Answer the commands of the TiledEngine until asked to stop."""
+        try:
+            while True:
+                command, arguments = pipe.recv()
+                if command == "load":
+                    self.load(*arguments)
+                    pipe.send(None)
+                elif command == "day":
+                    self.live_day()
+                    pipe.send(self.engine.population_counts())
+                elif command == "appeal":
+                    pipe.send(tuple(self.real_rows(appeal) for appeal in self.engine.appeal()))
+                elif command == "species_count_maps":
+                    pipe.send({species: self.real_rows(counts.ravel())
+                               for species, counts in self.engine.species_count_maps().items()})
+                elif command == "density_map":
+                    pipe.send(self.real_rows(self.engine.density_map().ravel()))
+                elif command == "stop":
+                    break
+        except Exception as error:
+            # Release the other bands waiting on an exchange or on a hand-off from this band. Each of them
+            # fails in turn and releases its own neighbors, so no band is left waiting
+            self.barrier.abort()
+            for neighbor, side in ((self.index - 1, 1), (self.index + 1, 0)):
+                if 0 <= neighbor < self.tiles:
+                    self.inboxes[neighbor][side].put(None)
+            pipe.send(error)
+        finally:
+            self.edges_memory.close()
+
+
+def _serve_tile(pipe, *arguments):
+    TileWorker(*arguments).serve(pipe)
+
+
+class TiledEngine:
+    """
+    Distributed counterpart of VectorizedEngine for very large grids: the grid is split into bands of rows,
+    one per worker process (see TileWorker).
+
+    ASSUMPTION: Each band draws its own random numbers, from a generator seeded by the engine, so a tiled
+    run is reproducible for a given number of tiles but matches the single-process engine statistically
+    rather than exactly. Only the bounded topology is supported.
+    """
+
+    def __init__(self, rows: int, cols: int, tiles: int | None = None, rng: np.random.Generator | None = None,
+                 config: SimulationConfig | None = None):
+        self.rows = rows
+        self.cols = cols
+        self.config = config if config is not None else SimulationConfig()
+        self.rng = rng if rng is not None else make_rng()  # Draws the world and the seeds of the bands
+        self.tiles = tile_count(rows, tiles)
+        self.ground = np.zeros(rows * cols, dtype=bool)
+        self.bounds = np.linspace(0, rows, self.tiles + 1).astype(int)
+        self.counts = {}
+        self.workers = []
+        self.pipes = []
+        self.edges_memory = None
+
+    def generate(self, terrain: str = "random"):
+        """Generate the world like VectorizedEngine.generate and hand each band to its worker."""
+        whole = VectorizedEngine(self.rows, self.cols, rng=self.rng, config=self.config)
+        whole.generate(terrain)
+        self.ground = whole.ground
+        self.counts = whole.population_counts()
+        self._start_workers()
+
+        row = whole.cell // self.cols
+        for index, pipe in enumerate(self.pipes):
+            start, stop = self.bounds[index], self.bounds[index + 1]
+            # Only the terrain of the halo rows is copied, their vegetobs belong to the neighboring bands
+            has_vegetebob = self._band_with_halo(whole.has_vegetebob, start, stop, False)
+            has_vegetebob[:self.cols] = has_vegetebob[-self.cols:] = False
+            pipe.send(("load", (self._band_with_halo(whole.ground, start, stop, False), has_vegetebob,
+                                np.where(has_vegetebob, self._band_with_halo(whole.density, start, stop, 0.0), 0.0),
+                                whole._take((row >= start) & (row < stop)))))
+        self._receive_all()
+
+    def _band_with_halo(self, array: np.ndarray, start: int, stop: int, fill):
+        # Returns the rows [start - 1, stop + 1) of a per-cell array, filled outside the grid
+        grid = array.reshape(self.rows, self.cols)
+        band = np.full((stop - start + 2, self.cols), fill, dtype=array.dtype)
+        first, last = max(start - 1, 0), min(stop + 1, self.rows)
+        band[first - (start - 1):last - (start - 1)] = grid[first:last]
+        return band.ravel()
+
+    def _start_workers(self):
+        self.close()
+        self.edges_memory = SharedMemory(create=True, size=self.tiles * 2 * self.cols * 8)
+        barrier = Barrier(self.tiles)
+        inboxes = [(Queue(), Queue()) for _ in range(self.tiles)]
+        try:
+            for index in range(self.tiles):
+                parent_pipe, child_pipe = Pipe()
+                worker = Process(target=_serve_tile, daemon=True,
+                                 args=(child_pipe, index, self.tiles, self.bounds[index], self.bounds[index + 1],
+                                       self.cols, self.edges_memory.name, barrier, inboxes,
+                                       int(self.rng.integers(2 ** 31)), self.config))
+                worker.start()
+                self.workers.append(worker)
+                self.pipes.append(parent_pipe)
+        except BaseException:
+            # Stop the workers already started and unlink the shared memory, nothing else would
+            for worker in self.workers:
+                worker.terminate()
+                worker.join()
+            self.workers = []
+            self.pipes = []
+            self.edges_memory.close()
+            self.edges_memory.unlink()
+            self.edges_memory = None
+            raise
+
+    def _receive_all(self) -> list:
+        answers = [pipe.recv() for pipe in self.pipes]
+        errors = [answer for answer in answers if isinstance(answer, Exception)]
+        if errors:
+            # Raise the error of the band that failed first, not those of the bands it released
+            released = (NeighborBandError, BrokenBarrierError)
+            raise next((error for error in errors if not isinstance(error, released)), errors[0])
+        return answers
+
+    def live_day(self):
+        for pipe in self.pipes:
+            pipe.send(("day", None))
+        counts = self._receive_all()
+        self.counts = {species: sum(band[species] for band in counts) for species in counts[0]}
+
+    def population_counts(self) -> dict:
+        return dict(self.counts)
+
+    def appeal(self):
+        """Gather the erbast and carviz appeal of the whole grid from the workers."""
+        for pipe in self.pipes:
+            pipe.send(("appeal", None))
+        bands = self._receive_all()
+        return tuple(np.concatenate([band[k] for band in bands]) for k in range(2))
+
+    def species_count_maps(self) -> dict:
+        """Gather the per-cell count of every species from the workers."""
+        for pipe in self.pipes:
+            pipe.send(("species_count_maps", None))
+        bands = self._receive_all()
+        return {species: np.concatenate([band[species] for band in bands]).reshape(self.rows, self.cols)
+                for species in bands[0]}
+
+    def terrain_map(self) -> np.ndarray:
+        return np.where(self.ground, GROUND_COLOR, WATER_COLOR).reshape(self.rows, self.cols)
+
+    def density_map(self) -> np.ndarray:
+        """Gather the vegetob density of every cell from the workers."""
+        for pipe in self.pipes:
+            pipe.send(("density_map", None))
+        return np.concatenate(self._receive_all()).reshape(self.rows, self.cols)
+
+    def close(self):
+        """Stop the workers and release the shared memory. Workers that do not stop in time are terminated."""
+        for pipe in self.pipes:
+            try:
+                pipe.send(("stop", None))
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The worker already ended after an error
+        for worker in self.workers:
+            worker.join(timeout=STOP_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.workers = []
+        self.pipes = []
+        if self.edges_memory is not None:
+            self.edges_memory.close()
+            self.edges_memory.unlink()
+            self.edges_memory = None
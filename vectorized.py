@@ -0,0 +1,313 @@
+import numpy as np
+
+from constants import WATER_COLOR, GROUND_COLOR
+from config import SimulationConfig
+from cells import compute_appeal, neighbor_table, best_neighbor_indices
+from generation import generate_state, make_rng
+
+# Column values of VectorizedEngine.species
+ERBAST = 0
+CARVIZ = 1
+
+# Names of the per-animal arrays of VectorizedEngine
+ANIMAL_COLUMNS = ("species", "energy", "lifetime", "age", "social_attitude", "cell", "group")
+
+
+class VectorizedEngine:
+    """
+    Array-backed counterpart of the object model in species.py and groups.py.
+
+    The world is held as flat per-cell arrays (terrain, vegetob density) and animals as columnar arrays
+    (species, energy, lifetime, age, social_attitude, cell, group). Every phase of a day runs as
+    whole-array operations, so the cost of a day no longer depends on the number of Python objects.
+
+    ASSUMPTION: Within a phase all groups read the same appeal snapshot instead of seeing the moves of
+    the groups processed before them.
+    """
+
+    def __init__(self, rows: int, cols: int, topology: str = "bounded", rng: np.random.Generator | None = None,
+                 config: SimulationConfig | None = None):
+        self.rows = rows
+        self.cols = cols
+        self.config = config if config is not None else SimulationConfig()  # Caps and rates of the world
+        self.rng = rng if rng is not None else make_rng()  # Source of all the random draws of the engine
+        self.topology = topology
+        self.neighbors, self.neighbors_valid = neighbor_table(rows, cols, topology)
+        self.n_cells = rows * cols  # Length of the per-cell arrays
+
+        # Per-cell state, indexed by x * cols + y
+        self.ground = np.zeros(self.n_cells, dtype=bool)
+        self.has_vegetebob = np.zeros(self.n_cells, dtype=bool)
+        self.density = np.zeros(self.n_cells, dtype=np.float64)
+
+        # Per-animal state
+        self.species = np.empty(0, dtype=np.int8)
+        self.energy = np.empty(0, dtype=np.float64)
+        self.lifetime = np.empty(0, dtype=np.int64)
+        self.age = np.empty(0, dtype=np.int64)
+        self.social_attitude = np.empty(0, dtype=np.float64)
+        self.cell = np.empty(0, dtype=np.int64)
+        self.group = np.empty(0, dtype=np.int64)  # -1 when the animal has no group
+
+        self._next_group = 0
+
+    # --- generation ---------------------------------------------------------------------------------
+
+    def generate(self, terrain: str = "random"):
+        """Generate the terrain and spawn one species per ground cell in bulk, see generation.generate_state."""
+        state = generate_state(self.rows, self.cols, self.rng, terrain, self.config, self.topology)
+        self.ground = state["ground"]
+        self.has_vegetebob = state["has_vegetebob"]
+        self.density = state["density"]
+        self._clear_animals()
+        self._append(state["animals"])
+
+    def _parameter(self, name: str, cells: np.ndarray):
+        """
+        Get a parameter of the configuration for the given cells, or for the animals in them.
+        A single world has one value for all its cells, see BatchedEngine for per-world values.
+        """
+        return getattr(self.config, name)
+
+    def _clear_animals(self):
+        for column in ANIMAL_COLUMNS:
+            setattr(self, column, getattr(self, column)[:0])
+        self._next_group = 0
+
+    def _spawn(self, cells: np.ndarray, species: int):
+        """Append newborn animals of the given species, one per entry of cells."""
+        n = len(cells)
+        self._append({
+            "species": np.full(n, species, dtype=np.int8),
+            "energy": self.rng.integers(1, self._parameter("max_energy", cells) + 1, size=n).astype(np.float64),
+            "lifetime": self.rng.integers(1, self._parameter("max_life", cells) + 1, size=n),
+            "age": np.zeros(n, dtype=np.int64),
+            "social_attitude": self.rng.uniform(0, 1, size=n),
+            "cell": cells.astype(np.int64),
+            "group": np.full(n, -1, dtype=np.int64),
+        })
+
+    def _append(self, columns: dict):
+        """Append animals given as a dict of columns, see ANIMAL_COLUMNS."""
+        for column in ANIMAL_COLUMNS:
+            setattr(self, column, np.concatenate([getattr(self, column), columns[column]]))
+
+    def _keep(self, mask: np.ndarray):
+        """Drop every animal where mask is False."""
+        for column in ANIMAL_COLUMNS:
+            setattr(self, column, getattr(self, column)[mask])
+
+    def _take(self, mask: np.ndarray) -> dict:
+        """Return the columns of the animals where mask is True."""
+        return {column: getattr(self, column)[mask] for column in ANIMAL_COLUMNS}
+
+    # --- queries ------------------------------------------------------------------------------------
+
+    def population_counts(self) -> dict:
+        return {
+            "vegetebob": int(self.has_vegetebob.sum()),
+            "erbast": int(np.count_nonzero(self.species == ERBAST)),
+            "carviz": int(np.count_nonzero(self.species == CARVIZ)),
+        }
+
+    def species_counts(self, species: int) -> np.ndarray:
+        """Return the per-cell count of the given animal species as a flat array."""
+        return np.bincount(self.cell[self.species == species], minlength=self.n_cells)
+
+    def appeal(self):
+        """
+        Compute the erbast and carviz appeal of every cell at once, with the rules of compute_appeal.
+        """
+        return compute_appeal(self.density * self.has_vegetebob, self.species_counts(ERBAST),
+                              self.species_counts(CARVIZ))
+
+    def species_count_maps(self) -> dict:
+        """Return the per-cell count of every species as rows x cols arrays."""
+        return {
+            "vegetebob": self.has_vegetebob.astype(np.int64).reshape(self.rows, self.cols),
+            "erbast": self.species_counts(ERBAST).reshape(self.rows, self.cols),
+            "carviz": self.species_counts(CARVIZ).reshape(self.rows, self.cols),
+        }
+
+    def terrain_map(self) -> np.ndarray:
+        return np.where(self.ground, GROUND_COLOR, WATER_COLOR).reshape(self.rows, self.cols)
+
+    def density_map(self) -> np.ndarray:
+        # Returns the vegetob density of every cell as a rows x cols array, 0 where there is no vegetob
+        return np.where(self.has_vegetebob, self.density, 0.0).reshape(self.rows, self.cols)
+
+    def is_quiescent(self) -> bool:
+        # Returns whether a day would leave the engine unchanged: no animal and no vegetob still growing
+        return len(self.species) == 0 and not (self.has_vegetebob & (self.density < 100)).any()
+
+    def best_neighbors(self, cells: np.ndarray, appeal: np.ndarray) -> np.ndarray:
+        """Return the best cell to move to from each of the given cells."""
+        return best_neighbor_indices(cells, appeal, self.ground, self.neighbors, self.neighbors_valid)
+
+    # --- daily phases -------------------------------------------------------------------------------
+
+    def live_day(self):
+        self._grow()
+        self._live_first_phase()
+        self._live_herds()
+        self._live_prides()
+
+    def _grow(self):
+        growing = np.flatnonzero(self.has_vegetebob & (self.density < 100))
+        self.density[growing] = np.minimum(self.density[growing] + self._parameter("growing", growing), 100)
+
+    def _assign_groups(self, mask: np.ndarray, key: np.ndarray):
+        """Give every animal in mask the id of a fresh group, one group per distinct key."""
+        unique_keys, inverse = np.unique(key, return_inverse=True)
+        self.group[mask] = self._next_group + inverse.ravel()
+        self._next_group += len(unique_keys)
+
+    def _join_oldest(self, members: np.ndarray):
+        """
+        Join the groups of the given members per cell, like Group.join: the oldest group of each cell stays
+        and the members of the other groups are left without a group until the next day.
+        """
+        cells = self.cell[members]
+        oldest = np.full(self.n_cells, np.iinfo(np.int64).max)
+        np.minimum.at(oldest, cells, self.group[members])
+        self.group[members[self.group[members] != oldest[cells]]] = -1
+
+    def _live_first_phase(self):
+        """Aging, group initiation and the spawn phase of every animal."""
+        self.age += 1
+        aging = np.flatnonzero(self.age % 10 == 0)
+        self.energy[aging] -= self._parameter("aging", self.cell[aging])
+
+        # Animals without a group form one group per species and cell
+        ungrouped = self.group < 0
+        if ungrouped.any():
+            self._assign_groups(ungrouped, self.cell[ungrouped] * 2 + self.species[ungrouped])
+
+        # Renumber the groups so that group ids stay below the number of animals
+        unique_groups, self.group = np.unique(self.group, return_inverse=True)
+        self.group = self.group.ravel()
+        self._next_group = len(unique_groups)
+
+        group_sizes = np.bincount(self.group, minlength=self._next_group)
+        old = self.age >= self.lifetime
+        parents = old & (group_sizes[self.group] < self._parameter("max_group", self.cell))
+        dead = old | (self.energy < 1)
+
+        newborn_cells = np.repeat(self.cell[parents], 2)
+        newborn_species = np.repeat(self.species[parents], 2)
+        self._keep(~dead)
+        self._spawn(newborn_cells[newborn_species == ERBAST], ERBAST)
+        self._spawn(newborn_cells[newborn_species == CARVIZ], CARVIZ)
+
+    def _move_groups(self, members: np.ndarray, appeal: np.ndarray) -> np.ndarray:
+        """
+        Move every group of the given members whose majority votes to move, like Group.movement.
+        :return: A per-animal mask of the members whose group moved
+        """
+        if len(members) == 0:
+            return np.zeros(len(self.cell), dtype=bool)
+        unique_groups, inverse = np.unique(self.group[members], return_inverse=True)
+        inverse = inverse.ravel()
+        votes = np.bincount(inverse, weights=self.energy[members] >= 4, minlength=len(unique_groups))
+        sizes = np.bincount(inverse, minlength=len(unique_groups))
+        moving_group = votes >= sizes / 2
+
+        # All members of a group share a cell, so any member gives the group's cell
+        group_cell = np.zeros(len(unique_groups), dtype=np.int64)
+        group_cell[inverse] = self.cell[members]
+        target = self.best_neighbors(group_cell, appeal)
+
+        moved = np.zeros(len(self.cell), dtype=bool)
+        moved[members] = moving_group[inverse]
+        leaving = moved & (self.energy == 1)
+        self.group[leaving] = -1
+        walking = moved & ~leaving
+        self.cell[walking] = target[inverse[walking[members]]]
+        self.energy[walking] -= 1
+        return moved
+
+    def _live_herds(self):
+        erbast = self._join_herds()
+        moved = self._move_groups(erbast, self.appeal()[0])
+        self._graze(moved)
+
+    def _join_herds(self) -> np.ndarray:
+        """
+        Herds in the same cell join the oldest one.
+        :return: The indices of the erbast that are in a herd
+        """
+        erbast = np.flatnonzero((self.species == ERBAST) & (self.group >= 0))
+        self._join_oldest(erbast)
+        return erbast[self.group[erbast] >= 0]
+
+    def _graze(self, moved: np.ndarray):
+        """Herds that stayed graze, one point of density per individual while there is density left."""
+        grazers = np.flatnonzero((self.species == ERBAST) & (self.group >= 0) & ~moved)
+        grazers = grazers[self.has_vegetebob[self.cell[grazers]]]
+        if len(grazers) == 0:
+            return
+        grazers = grazers[np.argsort(self.cell[grazers], kind="stable")]
+        cells, first, n_grazers = np.unique(self.cell[grazers], return_index=True, return_counts=True)
+        fed_count = np.minimum(n_grazers, np.ceil(np.maximum(self.density[cells], 0))).astype(np.int64)
+        rank = np.arange(len(grazers)) - np.repeat(first, n_grazers)
+        fed = grazers[rank < np.repeat(fed_count, n_grazers)]
+        self.energy[fed] += 1
+        self.density[cells] -= fed_count
+
+    def _live_prides(self):
+        carviz = self._join_prides()
+        moved = self._move_groups(carviz, self.appeal()[1])
+        self._fight_and_hunt(moved)
+
+    def _join_prides(self) -> np.ndarray:
+        """
+        Prides with a social attitude of at least 0.5 join the oldest sociable pride in their cell.
+        :return: The indices of the carviz that are in a pride
+        """
+        carviz = np.flatnonzero((self.species == CARVIZ) & (self.group >= 0))
+        if len(carviz) == 0:
+            return carviz
+        unique_groups, inverse = np.unique(self.group[carviz], return_inverse=True)
+        inverse = inverse.ravel()
+        attitude = (np.bincount(inverse, weights=self.social_attitude[carviz])
+                    / np.bincount(inverse))[inverse]
+        self._join_oldest(carviz[attitude >= 0.5])
+        return carviz[self.group[carviz] >= 0]
+
+    def _fight_and_hunt(self, moved: np.ndarray):
+        """Prides that share a cell fight, then the winners that did not move hunt."""
+        carviz = np.flatnonzero((self.species == CARVIZ) & (self.group >= 0))
+        if len(carviz) == 0:
+            return
+
+        # Prides in a cell where a pride stayed fight, and the winner is drawn with weights on its energy
+        unique_groups, first, inverse = np.unique(self.group[carviz], return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        strength = np.maximum(np.bincount(inverse, weights=self.energy[carviz]), 1e-12)
+        pride_cell = self.cell[carviz][first]
+        stayed = ~moved[carviz][first]
+        fighting = np.isin(pride_cell, pride_cell[stayed])
+        race = np.where(fighting, self.rng.exponential(size=len(unique_groups)) / strength, np.inf)
+        order = np.lexsort((race, pride_cell))
+        winner = ~fighting
+        winner[order[np.r_[True, pride_cell[order][1:] != pride_cell[order][:-1]]]] = True
+
+        alive = np.ones(len(self.cell), dtype=bool)
+        alive[carviz[~winner[inverse]]] = False
+
+        # Winning prides that did not move hunt the strongest erbast of their cell
+        hunters = winner & stayed
+        hunter_cells = pride_cell[hunters]
+        prey = np.flatnonzero(self.species == ERBAST)
+        prey = prey[np.isin(self.cell[prey], hunter_cells)]
+        if len(prey) > 0:
+            prey = prey[np.lexsort((-self.energy[prey], self.cell[prey]))]
+            strongest = prey[np.r_[True, self.cell[prey][1:] != self.cell[prey][:-1]]]
+            received = np.zeros(self.n_cells)
+            received[self.cell[strongest]] = self.energy[strongest]
+            hunter_size = np.bincount(inverse, minlength=len(unique_groups))[inverse]
+            fed = hunters[inverse]
+            self.energy[carviz[fed]] += received[self.cell[carviz[fed]]] / hunter_size[fed]
+            alive[strongest] = False
+
+        self._keep(alive)
@@ -2,16 +2,136 @@ import matplotlib.pyplot as plt
 from matplotlib.widgets import Button
 import numpy as np
 from world import World
+from simulation_thread import SimulationThread, DaySnapshot
 from matplotlib.animation import FuncAnimation
 
 
+class MapRenderer:
+    """
+    Draw the world map with artists created once: a terrain image whose data is replaced in place and one
+    scatter layer per species whose markers grow with the number of individuals in the cell.
+    Only the layers whose counts changed since the previous frame are updated.
+    """
+
+    # Color and horizontal offset inside the cell of the marker of each species
+    species_style = {
+        "vegetebob": ("yellow", -0.25),
+        "erbast": ("black", 0.0),
+        "carviz": ("red", 0.25),
+    }
+
+    def __init__(self, ax, snapshot: DaySnapshot):
+        self.ax = ax
+        self.ax.axis('off')
+
+        # Create a colormap for water and ground cells
+        cmap = plt.cm.colors.ListedColormap(['blue', 'green'])
+        self.terrain = self.ax.imshow(snapshot.terrain, cmap=cmap, vmin=0, vmax=1, interpolation="nearest")
+
+        self.layers = {}
+        for species, (color, _) in self.species_style.items():
+            self.layers[species] = self.ax.scatter([], [], s=[], c=color, marker="s", linewidths=0)
+        self.day_label = self.ax.text(0.01, 0.01, "", transform=self.ax.transAxes, color="white",
+                                      fontweight="bold", fontsize=8)
+        self.previous_counts = {}
+        self.update(snapshot)
+
+    def artists(self) -> list:
+        # The terrain is static between resets, so it stays in the blitted background
+        return [*self.layers.values(), self.day_label]
+
+    def reset(self, snapshot: DaySnapshot):
+        # Redraw the terrain, which only changes when a new world is generated
+        rows, cols = snapshot.terrain.shape
+        self.terrain.set_data(snapshot.terrain)
+        self.terrain.set_extent((-0.5, cols - 0.5, rows - 0.5, -0.5))
+        self.previous_counts = {}
+        return self.update(snapshot)
+
+    def update(self, snapshot: DaySnapshot) -> list:
+        """
+        Update the species layers and the day label with the state of a day.
+        :return: The artists to redraw
+        """
+        # Markers fill a cell when a species reaches 10 individuals in it
+        cols = self.terrain.get_array().shape[1]
+        cell_size = (self.ax.get_window_extent().width / max(cols, 1) * 72 / self.ax.figure.dpi) ** 2
+
+        for species, counts in snapshot.species_count_maps.items():
+            if species not in self.layers:
+                continue
+            previous = self.previous_counts.get(species)
+            if previous is not None and np.array_equal(previous, counts):
+                continue
+            self.previous_counts[species] = counts
+
+            x, y = np.nonzero(counts)
+            offset = self.species_style[species][1]
+            self.layers[species].set_offsets(np.column_stack([y + offset, x]))
+            self.layers[species].set_sizes(cell_size * np.minimum(counts[x, y], 10) / 40)
+
+        self.day_label.set_text(f"day: {snapshot.day}")
+        return self.artists()
+
+
+class PopulationGraph:
+    """
+    Draw the population of each species over the recent days, from the telemetry of the snapshots.
+    """
+
+    def __init__(self, ax, snapshot: DaySnapshot):
+        self.ax = ax
+        self.lines = {}
+        self.reset(snapshot)
+
+    def artists(self) -> list:
+        return list(self.lines.values())
+
+    def reset(self, snapshot: DaySnapshot):
+        # Initialize the population graph with empty data
+        self.ax.cla()
+        self.lines = {}
+        for species in snapshot.population_counts.keys():
+            line, = self.ax.plot([], [], label=species)
+            self.lines[species] = line
+        self.ax.legend()
+        self.update(snapshot)
+
+    def update(self, snapshot: DaySnapshot) -> bool:
+        """
+        Update the population graph with current data
+        ASSUMPTION: Extended mechanics.
+        :return: True if the limits of the graph changed, in which case the whole axes must be redrawn
+        """
+
+        # Update the lines of the population graph from the telemetry of the snapshot
+        days = snapshot.telemetry_days
+        for species, line in self.lines.items():
+            line.set_data(days, snapshot.telemetry[species])
+
+        # Grow the graph limits with some headroom when the data leaves them, so that they rarely change
+        x_min, x_max = self.ax.get_xlim()
+        y_max = self.ax.get_ylim()[1]
+        first_day, last_day = int(days[0]), int(days[-1])
+        highest = max(float(snapshot.telemetry[species].max()) for species in self.lines)
+        if last_day > x_max or first_day > x_min + (x_max - x_min) / 2 or highest > y_max:
+            span = max(last_day - first_day, 10)
+            self.ax.set_xlim(first_day, first_day + span * 1.5)
+            self.ax.set_ylim(0, max(highest, 1) * 1.5)
+            return True
+        return False
+
+
 class SimulationUI:
-    def __init__(self):
-        # Create the world and initialize variables
-        self.world = World()
+    normal_days_per_second = 10
+
+    def __init__(self, world: World | None = None, turbo_days_per_second: float | None = 200):
+        # Create the world and the thread that lives its days in the background
+        self.world = world if world is not None else World()
         self.world.generate()
-        self.day = 0
-        self.paused = True
+        self.turbo_days_per_second = turbo_days_per_second
+        self.simulation = SimulationThread(self.world, days_per_second=self.normal_days_per_second)
+        snapshot = DaySnapshot(self.world, with_terrain=True)
 
         # Create the figure and subplots for the map and buttons
         self.fig, (self.ax_graph, self.ax_map) = plt.subplots(nrows=1, ncols=2, figsize=(10, 5))
@@ -27,122 +147,66 @@ class SimulationUI:
         self.reset_button = Button(reset_button_ax, 'Reset', color='lightgoldenrodyellow', hovercolor='0.975')
         self.reset_button.on_clicked(self.reset)
 
+        # Create the turbo button, which switches between the normal and the turbo days per second
+        turbo_button_ax = plt.axes([0.30, 0.90, 0.15, 0.060])
+        self.turbo_button = Button(turbo_button_ax, 'Turbo', color='lightgoldenrodyellow', hovercolor='0.975')
+        self.turbo_button.on_clicked(self.toggle_turbo)
+
         # Display the initial world state
-        self.update_map()
+        self.map_renderer = MapRenderer(self.ax_map, snapshot)
 
-        # Set up the animation
-        self.anim = FuncAnimation(self.fig, self.run, interval=100)
+        # Display the population graph, fed from the telemetry of the snapshots
+        self.population_graph = PopulationGraph(self.ax_graph, snapshot)
 
-        # Data for population graph
-        self.population_data = {"carviz": [], "vegetebob": [], "erbast": []}
-        self.days_data = []
-        self.lines = {}
-        self.init_graph()
+        # Set up the animation, only the artists returned by run are redrawn on each frame
+        self.anim = FuncAnimation(self.fig, self.run, interval=50, blit=True, cache_frame_data=False)
+        self.fig.canvas.mpl_connect('close_event', lambda event: self.simulation.stop())
+        self.simulation.start()
 
         # Show the plot
         plt.show()
 
     def run(self, i):
-        # Animation function called for each frame
-        if not self.paused:
-            self.day += 1
-            self.world.live_day()
-            self.update_map()
-            self.update_graph()
+        # Animation function called for each frame: render the latest day, skipping the ones in between
+        snapshot = self.simulation.latest_snapshot()
+        if snapshot is not None:
+            if snapshot.terrain is not None:
+                self.map_renderer.reset(snapshot)
+                self.population_graph.reset(snapshot)
+                self.fig.canvas.draw_idle()
+            else:
+                self.update_map(snapshot)
+                self.update_graph(snapshot)
+        return self.map_renderer.artists() + self.population_graph.artists()
 
     def pause_start(self, event):
         # Event handler for pause/continue button
-        self.paused = not self.paused
-        if self.paused:
-            self.pause_continue_button.label.set_text("Start")
-        else:
+        if self.simulation.paused:
+            self.simulation.resume()
             self.pause_continue_button.label.set_text("Pause")
+        else:
+            self.simulation.pause()
+            self.pause_continue_button.label.set_text("Start")
 
     def reset(self, event):
-        # Event handler for reset button
-        self.world.generate()
-        self.day = 0
-        self.paused = True
+        # Event handler for reset button, the new world is drawn when its first snapshot arrives
+        self.simulation.request_reset()
         self.pause_continue_button.label.set_text("Start")
-        self.update_map()
-        self.init_graph()
-
-    def update_map(self):
-        # Update the map subplot with the current world state
-        self.ax_map.cla()
-
-        # Convert the Cell objects to integers
-        world_int = np.vectorize(int)(self.world.cells_grid)
-
-        # Create a colormap for water, ground, and species cells
-        cmap = plt.cm.colors.ListedColormap(['blue', 'green'])
 
-        # Plot the world grid
-        self.ax_map.imshow(world_int, cmap=cmap)
-        self.ax_map.axis('off')
-
-        # Define colors for species markers
-        species_colors = {
-            'V': 'yellow',
-            'E': 'black',
-            'C': 'red'
-        }
-
-        # Add species markers to the cells
-        for x in range(self.world.rows):
-            for y in range(self.world.cols):
-                cell = self.world.cells_grid[x, y]
-                population = cell.population
-
-                species_present = []
-                colors_present = []
-
-                # Determine which species are present in the cell and their colors
-                for species, individuals in population.items():
-                    if len(individuals) > 0:
-                        species_present.append(species[0].upper() + str(len(individuals)))
-                        colors_present.append(species_colors.get(species[0].upper(), 'black'))
-
-                # Add species markers to the cell
-                if len(species_present) > 0:
-                    for i, species_marker in enumerate(species_present):
-                        color = colors_present[i]
-                        self.ax_map.text(y + (i * 0.2), x, species_marker, color=color, ha="center", va="center",
-                                         fontweight="bold", fontsize=4)
-
-        # Set the label for the current day
-        self.ax_map.set_xlabel(f"day: {self.day}")
-
-        # Redraw the figure
-        self.fig.canvas.draw()
-
-    def init_graph(self):
-        # Initialize the population graph with empty data
-        self.ax_graph.cla()
-        self.population_data = {"carviz": [], "vegetebob": [], "erbast": []}
-        self.days_data = []
-        self.lines = {}
-        for species in self.population_data.keys():
-            line, = self.ax_graph.plot([], [], label=species)
-            self.lines[species] = line
-        self.ax_graph.legend()
-
-    def update_graph(self):
-        """
-        Update the population graph with current data
-        ASSUMPTION: Extended mechanics.
-        """
-
-        # append this day data to memory
-        for species, population in self.world.population.items():
-            self.population_data[species].append(len(population))
-        self.days_data.append(self.day)
+    def toggle_turbo(self, event):
+        # Event handler for turbo button
+        if self.simulation.days_per_second == self.normal_days_per_second:
+            self.simulation.set_days_per_second(self.turbo_days_per_second)
+            self.turbo_button.label.set_text("Normal")
+        else:
+            self.simulation.set_days_per_second(self.normal_days_per_second)
+            self.turbo_button.label.set_text("Turbo")
 
-        # Update the lines of the population graph
-        for species, line in self.lines.items():
-            line.set_data(self.days_data, self.population_data[species])
+    def update_map(self, snapshot: DaySnapshot):
+        # Update the map subplot with the state of a day
+        return self.map_renderer.update(snapshot)
 
-        # Rescale the graph to fit the data and redraw
-        self.ax_graph.relim()
-        self.ax_graph.autoscale_view()
-        self.fig.canvas.draw()
+    def update_graph(self, snapshot: DaySnapshot):
+        # Blitting only redraws the lines, so the axes are redrawn in full only when their limits change
+        if self.population_graph.update(snapshot):
+            self.fig.canvas.draw_idle()
@@ -1,91 +1,388 @@
-import numpy as np
 import random
+import time
+
+import numpy as np
 
 from species import Carviz, Erbast, Vegetebob
-from cells import Cell
-from groups import Group
-from constants import NUMCELLS_R, NUMCELLS_C, MAX_CARVIZ, MAX_ERBAST, MAX_VEGETOBOB
+from cells import Cell, compute_appeal, neighbor_table, best_neighbor_indices
+from groups import GroupRegistry, Herd, Pride
+from vectorized import VectorizedEngine, ANIMAL_COLUMNS
+from tiled import TiledEngine
+from checkpoint import save_world, load_world, restore_objects
+from generation import TERRAINS, generate_state, make_rng
+from telemetry import Telemetry
+from profiling import Profiler, profiled, start_instrumentation, stop_instrumentation
+from config import SimulationConfig
 
 
 class World:
-    def __init__(self, rows: int = NUMCELLS_R, cols: int = NUMCELLS_C):
-        """Initialize World with rows and cols, default to 100 each."""
-        self.rows = rows
-        self.cols = cols
+    available_engines = ("object", "vectorized", "tiled")
+    available_appeal_evaluations = ("cell", "grid")
+    available_topologies = ("bounded", "toroidal")
+    available_terrains = TERRAINS
+
+    def __init__(self, rows: int | None = None, cols: int | None = None, engine: str = "object",
+                 appeal_evaluation: str = "cell", topology: str = "bounded", tiles: int | None = None,
+                 telemetry: Telemetry | None = None, terrain: str = "random", seed: int | None = None,
+                 config: SimulationConfig | None = None):
+        """
+        Initialize World with rows and cols, default to those of config.
+
+        The sizes, caps and rates of the simulation are read from config (see SimulationConfig), which
+        defaults to the values of constants.py. Nothing of the world is stored on classes, so several worlds
+        with different configurations can coexist in one process.
+
+        The "object" engine simulates one Python object per cell and entity, the "vectorized" engine holds
+        the same world as arrays (see VectorizedEngine) and leaves cells_grid and population unset.
+        The "tiled" engine splits those arrays into bands of rows simulated by `tiles` worker processes,
+        one per core by default (see TiledEngine).
+
+        The population counts of every day are recorded in a bounded Telemetry store.
+
+        Cells whose content changed are only marked dirty. Before the groups decide their moves, the dirty
+        cells are evaluated one by one ("cell") or all together in one array pass ("grid").
+
+        The neighborhood of the cells is built once per grid. On a "toroidal" world the neighbors of the
+        border cells wrap around to the opposite border.
+
+        The terrain is a coin flip per cell ("random") or continents and lakes of smooth noise ("noise").
+
+        All the randomness of the world comes from its own generators seeded with seed, so a run is
+        reproducible from its configuration and seed. Without a seed, they are seeded from the global numpy
+        generator. Entities and groups hash by a serial id, so that the iteration order of their sets does
+        not depend on memory addresses either.
+        """
+        if engine not in self.available_engines:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {self.available_engines}")
+        if appeal_evaluation not in self.available_appeal_evaluations:
+            raise ValueError(f"Unknown appeal evaluation {appeal_evaluation!r}, "
+                             f"expected one of {self.available_appeal_evaluations}")
+        if topology not in self.available_topologies:
+            raise ValueError(f"Unknown topology {topology!r}, expected one of {self.available_topologies}")
+        if terrain not in self.available_terrains:
+            raise ValueError(f"Unknown terrain {terrain!r}, expected one of {self.available_terrains}")
+        if engine == "tiled" and topology != "bounded":
+            raise ValueError("The tiled engine only supports the bounded topology")
+        config = config if config is not None else SimulationConfig()
+        if rows is not None:
+            config = config.replace(rows=rows)
+        if cols is not None:
+            config = config.replace(cols=cols)
+        self.config = config
+        self.rows = config.rows
+        self.cols = config.cols
+        self.engine = engine
+        self.appeal_evaluation = appeal_evaluation
+        self.topology = topology
+        self.terrain = terrain
+        self.tiles = tiles
+        self.day = 0
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        self.neighbors, self.neighbors_valid = neighbor_table(self.rows, self.cols, topology)
+        self.surrounding_cells = None  # Surrounding Cell objects of each cell, by flat index
+        self.array_engine = None
         self.cells_grid = None
         self.population = None
+        self.dirty_cells = []  # Cells whose appeal must be evaluated again, may hold already evaluated cells
+        self.appeal_epoch = 0  # Incremented every day, see Cell.best_neighbor
+        self.growth_days = 0  # Days of vegetob growth of the object engine, see Vegetebob.density
+        self.active_cells = {}  # Cells holding at least one entity, by flat index
+        self.awake_cells = {}  # Active cells that are not quiescent, see Cell.is_quiescent
+        self.groups = GroupRegistry()  # Herds and prides of the object engine
+        self.profiler = None  # Profiler of the days, see enable_profiling
+        self.next_uid = 0  # Serial id of the next entity or group
+        self.seed_generators(seed)
+
+    def seed_generators(self, seed: int | None = None):
+        """
+        Seed the numpy Generator used for array draws (rng) and the random.Random used for the draws of
+        single entities (random).
+        """
+        self.rng = make_rng(seed)
+        self.random = random.Random(int(self.rng.integers(2 ** 63)))
+
+    def new_uid(self) -> int:
+        # Returns a serial id for a new entity or group
+        uid = self.next_uid
+        self.next_uid += 1
+        return uid
+
+    def generate(self, seed: int | None = None):
+        """
+        Generate a new world, after seeding the generators of the world again if seed is given. Generating
+        again without a seed continues the generators, so it gives a different but still reproducible world.
+        The terrain, the spawned species and the attributes of the animals are drawn in bulk array operations
+        (see generation.generate_state), then the object engine builds its cells and entities from them.
+        """
+        if seed is not None:
+            self.seed_generators(seed)
+        if self.engine != "object":
+            self.close()
+            if self.engine == "vectorized":
+                self.array_engine = VectorizedEngine(self.rows, self.cols, self.topology, self.rng, self.config)
+            else:
+                self.array_engine = TiledEngine(self.rows, self.cols, self.tiles, self.rng, self.config)
+            self.array_engine.generate(self.terrain)
+        else:
+            self._build_objects(generate_state(self.rows, self.cols, self.rng, self.terrain, self.config,
+                                               self.topology))
 
-    def generate(self):
+        self.restart_telemetry(day=0)
+
+    def restart_telemetry(self, day: int):
+        # Starts the telemetry over from the given day
+        self.day = day
+        self.telemetry.clear()
+        self.telemetry.record(self.day, self.population_counts())
+
+    def _reset(self):
+        """Clear the groups, the population and the cells of the object engine."""
         # Clear existing groups and initialize population dictionary
-        Group.all_groups = []
+        self.groups = GroupRegistry()
+        self.next_uid = 0
+        self.dirty_cells = []
+        self.growth_days = 0
+        self.active_cells = {}
+        self.awake_cells = {}
+        # Insertion-ordered dicts of the entities of each species, see Cell.population
         self.population = {
-            Vegetebob.name(): set(),
-            Erbast.name(): set(),
-            Carviz.name(): set(),
+            Vegetebob.name(): {},
+            Erbast.name(): {},
+            Carviz.name(): {},
         }
 
         # Create an empty grid of cells
         self.cells_grid = np.empty((self.rows, self.cols), dtype=Cell)
 
-        """Generate the world and return a 2D array of cells."""
-        Cell.assign_to_world(self)
+    def _link_surrounding_cells(self):
+        # Resolve the neighbor table to Cell objects once for the whole grid
+        cells = self.cells_grid.ravel()
+        self.surrounding_cells = [cells[row[valid]].tolist()
+                                  for row, valid in zip(self.neighbors, self.neighbors_valid)]
 
-        # Initialize each cell in the grid
-        for x in range(self.rows):
-            for y in range(self.cols):
-                self._initialize_cell(x, y)
+    def _build_objects(self, state: dict):
+        """
+        Build the cells and entities of the object engine from a state of generation.generate_state, with the
+        appeal of every cell evaluated in one array pass.
+        """
+        animals = state["animals"]
+        cells = self.rows * self.cols
+        erbast_appeal, carviz_appeal = compute_appeal(
+            state["density"],
+            np.bincount(animals["cell"][animals["species"] == 0], minlength=cells),
+            np.bincount(animals["cell"][animals["species"] == 1], minlength=cells))
+        vegetebob_cells = np.flatnonzero(state["has_vegetebob"])
+        arrays = {f"animal_{column}": animals[column] for column in ANIMAL_COLUMNS}
+        # Serial uids, the vegetobs first and then the animals
+        arrays.update({
+            "ground": state["ground"],
+            "appeal": np.column_stack([erbast_appeal, carviz_appeal]),
+            "vegetebob_uid": np.arange(len(vegetebob_cells)),
+            "vegetebob_cell": vegetebob_cells,
+            "vegetebob_density": state["density"][vegetebob_cells],
+            # Every ground cell spawns at most one entity, and no group exists yet
+            "vegetebob_cell_rank": np.zeros(len(vegetebob_cells), dtype=np.int64),
+            "animal_uid": len(vegetebob_cells) + np.arange(len(animals["cell"])),
+            "animal_energy": animals["energy"].astype(np.int64),
+            "animal_cell_rank": np.zeros(len(animals["cell"]), dtype=np.int64),
+            "animal_group_rank": np.zeros(len(animals["cell"]), dtype=np.int64),
+            "group_uid": np.empty(0, dtype=np.int64),
+            "group_total_energy": np.empty(0, dtype=np.float64),
+            "group_cell_rank": np.empty(0, dtype=np.int64),
+            "group_type": np.empty(0, dtype=np.int8),
+            "group_cell": np.empty(0, dtype=np.int64),
+        })
+        restore_objects(self, arrays)
 
-    def _initialize_cell(self, x: int, y: int):
-        """Initialize a single cell at position (x, y)."""
-        # Create water cells at the boundary
-        if self._is_boundary(x, y):
-            self.cells_grid[x, y] = Cell(x=x, y=y, cell_type="water")
-        else:
-            # Initialize other cells with a random type
-            cell_type = np.random.choice(Cell.available_cell_types())
-            self.cells_grid[x, y] = Cell(x=x, y=y, cell_type=cell_type)
-            self._initialize_species(x, y)
+    def live_day(self):
+        start = time.perf_counter()
+        # The vegetobs grow when their density is read, so a new day only advances their growth clock and
+        # invalidates the memoized best neighbors
+        self.growth_days += 1
+        self.appeal_epoch += 1
+        # A day of a quiescent world would not change anything else
+        if not self.is_quiescent():
+            if self.engine != "object":
+                self.array_engine.live_day()
+            else:
+                self._live_object_day()
+        self.day += 1
+        if self.profiler is not None:
+            self.profiler.add_time("day", time.perf_counter() - start)
+            self.profiler.end_day(self.day)
+        self.telemetry.record(self.day, self.population_counts())
 
-    def _initialize_species(self, x: int, y: int):
+    def is_quiescent(self) -> bool:
         """
-        Initialize a species at the cell in position (x, y).
+        Whether living a day only advances the growth of the vegetobs: no animal is left. The vectorized
+        engine grows its densities eagerly, so it also needs every vegetob to be saturated.
+        Without animals, the state of the world no longer draws random numbers and only moves towards
+        saturation, so this steady state is the only state that can repeat.
 
-        ASSUMPTION: Only one type of species can be spawned per cell at once.
+        ASSUMPTION: The tiled engine is never reported quiescent, its state is spread over its workers.
         """
-        if self.cells_grid[x, y].cell_type == "ground":
-            # Determine available species to be spawned based on population limits
-            available_creatures = []
-            if len(self.population[Erbast.name()]) <= MAX_ERBAST:
-                available_creatures.append(Erbast)
-            if len(self.population[Vegetebob.name()]) <= MAX_VEGETOBOB:
-                available_creatures.append(Vegetebob)
-            if len(self.population[Carviz.name()]) <= MAX_CARVIZ:
-                available_creatures.append(Carviz)
+        if self.engine == "object":
+            return not self.awake_cells and not self.dirty_cells
+        if self.engine == "vectorized":
+            return self.array_engine.is_quiescent()
+        return False
 
-            if len(available_creatures) == 0:
+    def live_days(self, days: int):
+        """
+        Live the given number of days. Once the world is quiescent, the remaining days are skipped in one
+        step: they are only recorded in the telemetry, with the same counts as if every day had been lived,
+        in a time bounded by its capacities (see Telemetry.record_repeated). Skipped days are not profiled.
+        """
+        for lived in range(days):
+            if self.is_quiescent():
+                self.telemetry.record_repeated(self.day + 1, days - lived, self.population_counts())
+                self.day += days - lived
+                self.growth_days += days - lived
                 return
+            self.live_day()
 
-            # Randomly choose a species from the available ones and spawn an instance
-            species = random.choice(available_creatures)
-            species_instance = species(spawn_cell=self.cells_grid[x, y])
-            self.population[species_instance.name()].add(species_instance)
+    def _live_object_day(self):
+        self._live_first_phase()
 
-    def _is_boundary(self, x: int, y: int):
-        """Check if cell is on the boundary."""
-        return x == 0 or x == self.rows - 1 or y == 0 or y == self.cols - 1
+        # Evaluate the appeal of the cells changed by the first phase before the groups decide to move
+        self.evaluate_dirty_cells()
 
-    def live_day(self):
-        # Execute the live_first_phase_of_a_day() method for each species in each cell
-        for row in self.cells_grid:
-            for cell in row:
-                for species in cell.population.values():
-                    for instance in list(species):
-                        instance.live_first_phase_of_a_day()
+        self._live_groups()
+
+    @profiled("first_phase")
+    def _live_first_phase(self):
+        # Execute the live_first_phase_of_a_day() method for each species in each cell that is not quiescent,
+        # the entities of quiescent cells would not change anything.
+        # Sorting the flat indices keeps the row by row order of a sweep over the whole grid.
+        for cell in [self.awake_cells[index] for index in sorted(self.awake_cells)]:
+            for species in cell.population.values():
+                for instance in list(species):
+                    instance.live_first_phase_of_a_day()
+
+    @profiled("groups")
+    def _live_groups(self):
+        # Execute the live_day() method for each herd, then for each pride, and drop the deleted groups
+        for group_class in (Herd, Pride):
+            for group in self.groups.of_type(group_class.name()):
+                group.live_day()
+        self.groups.compact()
+
+    @profiled("appeal_evaluation")
+    def evaluate_dirty_cells(self):
+        """Evaluate the appeal of every cell marked dirty since the last evaluation."""
+        dirty_cells = [cell for cell in self.dirty_cells if cell.appeal_dirty]
+        self.dirty_cells = []
+        if self.appeal_evaluation == "cell":
+            for cell in dirty_cells:
+                cell.trigger_appeal_evaluation()
+            return
+
+        erbast_appeal, carviz_appeal = compute_appeal(*self._cell_contents(dirty_cells))
+        for cell, erbast, carviz in zip(dirty_cells, erbast_appeal.tolist(), carviz_appeal.tolist()):
+            cell.set_appeal(erbast, carviz)
+
+    def appeal_maps(self):
+        """
+        Compute the erbast and carviz appeal of the whole grid in one array pass.
+        :return: The (erbast appeal, carviz appeal) pair of rows x cols arrays
+        """
+        if self.engine != "object":
+            erbast_appeal, carviz_appeal = self.array_engine.appeal()
+            return erbast_appeal.reshape(self.rows, self.cols), carviz_appeal.reshape(self.rows, self.cols)
+
+        erbast_appeal, carviz_appeal = compute_appeal(*self._cell_contents(self.cells_grid.ravel()))
+        return erbast_appeal.reshape(self.rows, self.cols), carviz_appeal.reshape(self.rows, self.cols)
+
+    def best_neighbor_map(self, species: str):
+        """
+        Find the cell that an individual of the given species would move to from every cell of the grid,
+        in a single gather and argmax over the neighbor table.
+        :return: A rows x cols array of flat cell indices
+        """
+        erbast_appeal, carviz_appeal = self.appeal_maps()
+        appeal = (erbast_appeal if species == Erbast.name() else carviz_appeal).ravel()
+        if self.engine != "object":
+            walkable = self.array_engine.ground
+        else:
+            walkable = np.fromiter((cell.cell_type != "water" for cell in self.cells_grid.ravel()), dtype=bool,
+                                   count=self.rows * self.cols)
+        best = best_neighbor_indices(np.arange(self.rows * self.cols), appeal, walkable, self.neighbors,
+                                     self.neighbors_valid)
+        return best.reshape(self.rows, self.cols)
+
+    @staticmethod
+    def _cell_contents(cells):
+        # Returns the vegetob density, erbast count and carviz count of the given cells as arrays
+        return (np.fromiter((cell.vegetebob_density() for cell in cells), dtype=float, count=len(cells)),
+                np.fromiter((len(cell.population["erbast"]) for cell in cells), dtype=int, count=len(cells)),
+                np.fromiter((len(cell.population["carviz"]) for cell in cells), dtype=int, count=len(cells)))
+
+    def terrain_map(self) -> np.ndarray:
+        # Returns the color code of every cell as a rows x cols array
+        if self.engine != "object":
+            return self.array_engine.terrain_map()
+        return np.fromiter((int(cell) for cell in self.cells_grid.ravel()), dtype=np.int64,
+                           count=self.rows * self.cols).reshape(self.rows, self.cols)
+
+    def species_count_maps(self) -> dict:
+        """Return the number of individuals of each species in every cell, as rows x cols arrays."""
+        if self.engine != "object":
+            return self.array_engine.species_count_maps()
+        counts = {name: np.zeros(self.rows * self.cols, dtype=np.int64) for name in self.population}
+        for index, cell in self.active_cells.items():
+            for name, individuals in cell.population.items():
+                counts[name][index] = len(individuals)
+        return {name: species_counts.reshape(self.rows, self.cols) for name, species_counts in counts.items()}
+
+    def density_map(self) -> np.ndarray:
+        """Return the vegetob density of every cell as a rows x cols array, 0 where there is no vegetob."""
+        if self.engine != "object":
+            return self.array_engine.density_map()
+        densities = np.zeros(self.rows * self.cols)
+        for vegetebob in self.population[Vegetebob.name()]:
+            densities[vegetebob.current_cell.index] = vegetebob.density
+        return densities.reshape(self.rows, self.cols)
+
+    def population_counts(self) -> dict:
+        # Return the number of individuals of each species, whatever the engine
+        if self.engine != "object":
+            return self.array_engine.population_counts()
+        return {name: len(species) for name, species in self.population.items()}
+
+    def enable_profiling(self, capacity: int = 1000) -> Profiler:
+        """
+        Record the wall time of the phases of each day and count its events, for the last `capacity` days.
+        The array engines only report the time of the whole day.
+        :return: The Profiler holding the records
+        """
+        if self.profiler is None:
+            start_instrumentation()
+        self.profiler = Profiler(capacity)
+        return self.profiler
+
+    def disable_profiling(self):
+        if self.profiler is not None:
+            stop_instrumentation()
+        self.profiler = None
+
+    def save(self, path):
+        """Save the whole state of the world, and of the random generators, to a checkpoint file."""
+        save_world(self, path)
+
+    @classmethod
+    def load(cls, path, restore_random_state: bool = True):
+        """
+        Load a world saved with save(). With the random state restored, it continues exactly like the saved
+        world would have, on both engines.
+        """
+        return load_world(cls, path, restore_random_state)
 
-        # Execute the live_day() method for each group
-        for group in Group.all_groups:
-            group.live_day()
+    def close(self):
+        # Release the worker processes of the tiled engine, if any
+        if isinstance(self.array_engine, TiledEngine):
+            self.array_engine.close()
 
     def print_population_data(self):
         # Print the population data for each species
-        print(self.population.keys(), [len(species) for species in self.population.values()])
+        population_counts = self.population_counts()
+        print(population_counts.keys(), list(population_counts.values()))